@@ -1,6 +1,7 @@
 # coding: utf-8
 from __future__ import print_function
 
+from spinoff.actor.mailbox import BLOCK
 from spinoff.actor.props import Props
 
 
@@ -24,6 +25,20 @@ class Actor(object):
 
     receive = run = None
 
+    # `receive` runs directly in the greenlet of the actor; actors whose `receive` mostly blocks can set this to `False`
+    # to have each message processed in a separate greenlet instead, at the cost of a greenlet per message
+    inline = True
+
+    # the max. number of messages processed in one go before letting other actors run; `None` means `Cell.default_throughput`;
+    # can also be set per actor using `Actor.using(..., _throughput=N)`
+    throughput = None
+
+    # the max. number of messages pending in the mailbox of the actor (`None` means unbounded) and what to do when it's
+    # full; see `spinoff.actor.mailbox`; can also be set per actor using `Actor.using(..., _mailbox_capacity=N)` and
+    # `Actor.using(..., _mailbox_overflow=DROP_OLDEST)`
+    mailbox_capacity = None
+    mailbox_overflow = BLOCK
+
     def spawn(self, factory, name=None):
         return self.__cell.spawn_actor(factory, name)
 
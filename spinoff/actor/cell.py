@@ -5,18 +5,18 @@ import abc
 import sys
 import traceback
 import warnings
-import weakref
 from collections import deque
 from itertools import count
 
 import gevent
 import gevent.event
 import gevent.queue
-from gevent import GreenletExit, Greenlet
+from gevent import GreenletExit
 from gevent.queue import Empty
 
-from spinoff.actor.events import Events, UnhandledMessage, DeadLetter, Error
+from spinoff.actor.events import UnhandledMessage, DeadLetter, Error
 from spinoff.actor.exceptions import NameConflict, LookupFailed, Unhandled, UnhandledTermination
+from spinoff.actor.mailbox import Mailbox, Stash, BLOCK, DROP_NEWEST
 from spinoff.actor.props import Props
 from spinoff.actor.ref import Ref
 from spinoff.actor.uri import Uri
@@ -27,9 +27,14 @@ from spinoff.util.pattern_matching import OR
 
 _NOSENDER = None
 
+# system messages are put in the priority lane of the `Mailbox` as `(tag, arg)` so that letters never need to be
+# compared against all of the control message patterns
+_SYSTEM_TAGS = frozenset(['_watched', '_unwatched', '_node_down', '_child_terminated'])
+
 
 class _BaseCell(object):
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     _children = {}  # XXX: should be a read-only dict
     child_name_gen = None
@@ -97,7 +102,7 @@ class _BaseCell(object):
         steps = uri.steps
         if steps[0] == '':
             found = self.root
-            steps.popleft()
+            steps = steps[1:]
         else:
             found = self
         for step in steps:
@@ -119,135 +124,205 @@ class _BaseCell(object):
         return cell.ref
 
 
-class Cell(Greenlet, _BaseCell):
-    uri = None
-    node = None
-    actor = None
-    proc = None
-    stash = None
-    stopped = False
-
-    inbox = None
+class Cell(_BaseCell):
+    __slots__ = ('factory', 'parent_actor', 'uri', 'node', 'actor', 'proc', 'stash', 'ch', 'get_pt', 'stopped',
+                 'started', 'processing', 'stopping', 'mailbox', 'throughput', '_inline_proc', 'context', 'ref',
+                 '_children', 'child_name_gen', 'watchers', 'watchees', '__weakref__')
 
-    _ref = None
-    child_name_gen = None
-
-    watchers = None
-    watchees = None
+    # the default number of letters processed in a row before yielding to other actors
+    default_throughput = 10
 
     def __init__(self, parent_actor, factory, uri, node):
-        Greenlet.__init__(self)
         if not callable(factory):  # pragma: no cover
             raise TypeError("Provide a callable (such as a class, function or Props) as the factory of the new actor")
+        if not node.guardian:  # as with `Node.spawn`, nothing can be spawned once the node has stopped
+            raise RuntimeError("Node already stopped")
         self.factory = factory
         self.parent_actor = parent_actor
         self.uri = uri
         self.node = node
-        self.queue = gevent.queue.Queue()
-        self.inbox = deque()
+        self.actor = self.proc = self.stash = self.ch = self.get_pt = None
+        self.stopped = False
+        # the actor has been constructed, i.e. the cell has run its first step
+        self.started = False
+        # letters cannot be processed while waiting for a '__done' from `proc` or from `get`
+        self.processing = False
+        # a '_stop' arrived while processing; the actor stops once it's done
+        self.stopping = False
+        self.mailbox = Mailbox(self, getattr(factory, 'mailbox_capacity', None),
+                               getattr(factory, 'mailbox_overflow', None) or BLOCK)
+        self.throughput = getattr(factory, 'throughput', None) or Cell.default_throughput
+        # the greenlet currently running an inline `receive`; used to interrupt it if the actor gets killed meanwhile
+        self._inline_proc = None
+        # the `Context` handed out by `get_context`; only created once asked for
+        self.context = None
+        # the one and only `Ref` of the cell; the cycle is broken by `destroy`, so stopped cells are freed even if
+        # their `Ref` is still around somewhere
+        self.ref = Ref(cell=self, uri=uri, node=node)
+        node.guardian.cells[uri.path] = self
+        # children, watchers and watchees are only allocated once there are any
+        self._children = _BaseCell._children
+        self.child_name_gen = self.watchers = self.watchees = None
 
     @logstring(u'←')
     def receive(self, message, _sender):
-        self.queue.put((_sender, message))
+        cls = message.__class__
+        if cls is tuple:
+            if len(message) == 2 and message[0].__class__ is str and message[0] in _SYSTEM_TAGS:
+                self.mailbox.put_system(*message)
+                return
+        elif cls is str and (message == '_stop' or message == '_kill'):
+            if self._inline_proc and message == '_kill':
+                gevent.get_hub().loop.run_callback(self._interrupt)
+            self.mailbox.put_system(message)
+            return
+        mailbox = self.mailbox
+        if not mailbox.put(_sender, message) and mailbox.overflow is not DROP_NEWEST:
+            self.node.events.log(DeadLetter(self.ref, message, _sender))
+
+    def signal(self, tag, arg=None):
+        """Puts an internal system message in the mailbox."""
+        self.mailbox.put_system(tag, arg)
+
+    def _interrupt(self):
+        # only ever called from the hub, so if `_inline_proc` is still set, the inline `receive` is blocked
+        if self._inline_proc:
+            self._inline_proc.throw(GreenletExit)
+
+    @classmethod
+    def spawn(cls, *args, **kwargs):
+        cell = cls(*args, **kwargs)
+        cell.mailbox.schedule()  # the actor is constructed in the first step
+        return cell
 
     @logstring(u'↻')
-    def _run(self):
-        def _stop():
-            # dbg("STOP")
-            self.shutdown()
-            self.destroy()
-            gevent.getcurrent().kill()
-
-        # dbg(u"►►")
-        try:
-            self.actor = self.construct()
-        except Exception:
-            self.report()
-            _stop()
-            return
-        processing = True if self.actor.run else False
-        stopped = False
-        while True:
-            # dbg("processing: %r, error: %r, suspended: %r, stash size: %s, active: %r" % (processing, error, suspended, len(self.stash) if self.stash is not None else '-'))
-            # consume the queue, handle system messages, and collect letters to the inbox
-            if processing or not self.inbox:
-                self.queue.peek()
-            while True:
-                try:
-                    sender, m = self.queue.get_nowait()
-                except gevent.queue.Empty:
-                    break
-                # dbg("@ CTRL:", m)
-                if m == '__done':
+    def step(self):
+        """Processes the pending system messages and a batch of letters; returns `True` if there is more to do."""
+        if not self.started:
+            self.started = True
+            try:
+                self.actor = self.construct()
+            except Exception:
+                self.report()
+                self._stop()
+                return False
+            self.processing = True if self.actor.run else False
+        processing = self.processing
+        actor, mailbox = self.actor, self.mailbox
+        letters, system = mailbox.letters, mailbox.system
+        # dbg("processing: %r, error: %r, suspended: %r, stash size: %s, active: %r" % (processing, error, suspended, len(self.stash) if self.stash is not None else '-'))
+        # handle system messages first
+        while system:
+            tag, arg = system.popleft()
+            # dbg("@ CTRL:", tag, arg)
+            if tag == '__done':
+                processing = False
+                if not self.stopping:
+                    continue
+                tag = '_stop'  # fall thru to the _stop/_kill handler
+            elif tag == '__undone':
+                processing = True
+                continue
+            if tag == '__error':
+                self.report(arg)
+                self._stop()
+                return False
+            elif tag == '_stop' or tag == '_kill':
+                if tag == '_kill':
                     processing = False
-                    if stopped:
-                        m = '_stop'  # fall thru to the _stop/_kill handler
-                    else:
-                        continue
-                elif m == '__undone':
-                    processing = True
+                if not processing:
+                    if self.proc:
+                        self.proc.kill()
+                    self._stop()
+                    return False
+                else:
+                    self.stopping = True
+            elif tag == '_watched':
+                self._watched(arg)
+            elif tag == '_unwatched':
+                self._unwatched(arg)
+            elif tag == '_node_down':
+                letters.extend((_NOSENDER, ('terminated', x)) for x in (self.watchees or []) if x.uri.node == arg)
+            elif tag == '_child_terminated':
+                self._child_gone(arg)
+        # process the normal letters (i.e. the regular, non-system/non-special messages), at most `throughput` at a
+        # time; any new system message interrupts the batch so that e.g. a '_stop' takes effect immediately
+        budget = self.throughput
+        while budget and not processing and not system and letters:
+            budget -= 1
+            sender, m = letters.popleft()
+            # dbg("@ NORMAL:", m)
+            if m.__class__ is tuple and len(m) == 2 and m[0] == 'terminated':
+                _, watchee = m
+                if self.watchees and watchee in self.watchees:
+                    self.watchees.remove(watchee)
+                    self._unwatch(watchee, silent=True)
+                else:
                     continue
-                if m == ('__error', ANY, ANY):
-                    _, exc, tb = m
-                    self.report((exc, tb))
-                    _stop()
-                elif m in ('_kill', '_stop'):
-                    if m == '_kill':
-                        processing = False
-                    if not processing:
-                        if self.proc:
-                            self.proc.kill()
-                        _stop()
-                    else:
-                        stopped = True
-                elif m == ('_watched', ANY):
-                    self._watched(m[1])
-                elif m == ('_unwatched', ANY):
-                    self._unwatched(m[1])
+            actor.sender = sender
+            if self.context is not None:
+                self.context.sender = sender
+            if actor.receive:
+                if actor.inline:
+                    processing = self.receive_inline(m, sender)
                 else:
-                    if m == ('_node_down', ANY):
-                        _, node = m
-                        self.inbox.extend((_NOSENDER, ('terminated', x)) for x in (self.watchees or []) if x.uri.node == node)
-                    else:
-                        self.inbox.append((sender, m))
-            # process the normal letters (i.e. the regular, non-system/non-special messages)
-            while not processing and self.queue.empty() and self.inbox:
-                sender, m = self.inbox.popleft()
-                # dbg("@ NORMAL:", m)
-                if m == ('terminated', ANY):
-                    _, actor = m
-                    if self.watchees and actor in self.watchees:
-                        self.watchees.remove(actor)
-                        self._unwatch(actor, silent=True)
-                    else:
-                        continue
-                elif m == ('_child_terminated', ANY):
-                    self._child_gone(m[1])
-                    break
-                self.actor.sender = sender
-                if self.actor.receive:
                     processing = True
-                    self.proc = gevent.spawn(self.catch_exc, self.catch_unhandled, self.actor.receive, m, sender)
+                    self.proc = gevent.spawn(self.catch_exc, self.catch_unhandled, actor.receive, m, sender)
                     self.proc._cell = self
-                elif self.actor.run:
-                    assert self.ch.balance == -1
-                    if self.get_pt == m:
-                        processing = True
-                        self.ch.put(m)
-                        self.inbox.extendleft(reversed(self.stash))
-                        self.stash.clear()
-                    else:
-                        self.stash.append((sender, m))
+            elif actor.run:
+                assert self.ch.balance == -1
+                # the stash has already been searched by `get`, so only the new letters need to be matched
+                if self.get_pt == m:
+                    processing = True
+                    self.ch.put(m)
                 else:
-                    self.catch_exc(self.unhandled, m, sender)
+                    self.stash.append(sender, m)
+            else:
+                self.catch_exc(self.unhandled, m, sender)
+        self.processing = processing
+        if mailbox.blocked:
+            mailbox.release()
+        # letters can only be waited for if they can also be processed
+        if system or letters and not processing:
+            return True
+        mailbox.scheduled = False
+        return False
+
+    def _stop(self):
+        # dbg("STOP")
+        self.shutdown()
+        self.destroy()
+
+    def crash(self):
+        """Reports the exception that escaped `step` and stops the actor as if its `receive` had raised it."""
+        self.report()
+        if not self.stopped:
+            try:
+                self._stop()
+            except Exception:  # pragma: no cover
+                self.report()
 
     def catch_exc(self, fn, *args, **kwargs):
         try:
             fn(*args, **kwargs)
         except Exception:
-            self.queue.put((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
+            self.signal('__error', sys.exc_info()[1:])
         else:
-            self.queue.put((_NOSENDER, '__done'))
+            self.signal('__done')
+
+    def receive_inline(self, m, sender):
+        """Runs `receive` in the current greenlet; returns `True` if the actor is now waiting for an '__error'."""
+        self._inline_proc = gevent.getcurrent()
+        try:
+            self.catch_unhandled(self.actor.receive, m, sender)
+        except GreenletExit:
+            pass  # killed while blocked; the '_kill' is already in the mailbox
+        except Exception:
+            self.signal('__error', sys.exc_info()[1:])
+            return True
+        finally:
+            self._inline_proc = None
+        return False
 
     def catch_unhandled(self, fn, m, sender):
         try:
@@ -259,20 +334,27 @@ class Cell(Greenlet, _BaseCell):
 
     def get(self, pattern=ANY, timeout=None):
         assert timeout is None or isinstance(timeout, (int, float))
+        # the stashed letters arrived before anything still in the mailbox, so they take precedence
+        found = self.stash.pop_match(pattern)
+        if found is not None:
+            sender, m = found
+            self.actor.sender = sender
+            if self.context is not None:
+                self.context.sender = sender
+            return m
         self.get_pt = pattern
-        self.queue.put((_NOSENDER, '__done'))
+        self.signal('__done')
         try:
             return self.ch.get(timeout=timeout)
         except Empty:
-            self.queue.put((_NOSENDER, '__undone'))
+            self.signal('__undone')
             raise
 
     def get_nowait(self, pattern):
         return self.get(pattern, timeout=0.0)
 
     def flush(self):
-        while self.stash:
-            sender, m = self.stash.popleft()
+        for sender, m in self.stash.popall():
             self.unhandled(m, sender)
 
     # birth & death
@@ -292,7 +374,7 @@ class Cell(Greenlet, _BaseCell):
                 raise TypeError("actor should implement only run() or receive() but not both")
             self.proc = gevent.spawn(self.wrap_run, actor.run)
             self.proc._cell = self
-            self.stash = deque()
+            self.stash = Stash()
         return actor
 
     def wrap_run(self, fn):
@@ -301,12 +383,12 @@ class Cell(Greenlet, _BaseCell):
         except GreenletExit:
             ret = None
         except:
-            self.queue.put((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
+            self.signal('__error', sys.exc_info()[1:])
             return
         if ret is not None:
             warnings.warn("Process.run should not return anything--it's ignored")
-        self.queue.put((_NOSENDER, '__done'))
-        self.queue.put((_NOSENDER, '_stop'))
+        self.signal('__done')
+        self.signal('_stop')
 
     def shutdown(self, term_msg='_stop'):
         if hasattr(self.actor, 'post_stop'):
@@ -318,48 +400,48 @@ class Cell(Greenlet, _BaseCell):
             self._unwatch(self.watchees.pop())
         for child in self.children:
             child << term_msg
-        stash = deque()
-        self.queue.queue.extendleft(reversed(self.inbox))
-        self.inbox.clear()
+        # wait for the children to stop, leaving everything else in the mailbox for `destroy`
+        system, other = self.mailbox.system, deque()
         while self.children:
-            sender, m = self.queue.get()
-            if m == ('_child_terminated', ANY):
-                self._child_gone(m[1])
-            else:
-                stash.appendleft((sender, m))
-        self.queue.queue.extendleft(stash)
+            if not system:
+                self.mailbox.wait()
+            while system:
+                tag, arg = system.popleft()
+                if tag == '_child_terminated':
+                    self._child_gone(arg)
+                else:
+                    other.append((tag, arg))
+        system.extendleft(reversed(other))
 
     def destroy(self):
-        if self._ref and self._ref():
-            ref = self._ref()  # grab the ref before we stop, otherwise ref() returns a dead ref
-            self.stopped = True
-            ref._cell = None
-            self._ref = None
-        else:
-            self.stopped = True
-            ref = self.ref
-        while True:
-            try:
-                sender, m = self.queue.get_nowait()
-            except gevent.queue.Empty:
-                break
-            if m == ('_watched', ANY):
-                self._watched(m[1])
-            elif m == ('__error', ANY, ANY):
-                _, exc, tb = m
-                self.report((exc, tb))
-            elif not (m == ('terminated', ANY) or m == ('_unwatched', ANY) or m == ('_node_down', ANY) or m == '_stop' or m == '_kill' or m == '__done' or m == '__undone'):
-                Events.log(DeadLetter(ref, m, sender))
+        self.stopped = True
+        ref = self.ref
+        ref._cell = None
+        guardian = self.node.guardian
+        if guardian and guardian.cells.get(self.uri.path) is self:
+            del guardian.cells[self.uri.path]
+        self.mailbox.close()
+        system, letters = self.mailbox.system, self.mailbox.letters
+        while system:
+            tag, arg = system.popleft()
+            if tag == '_watched':
+                self._watched(arg)
+            elif tag == '__error':
+                self.report(arg)
+        while letters:
+            sender, m = letters.popleft()
+            if not m == ('terminated', ANY):
+                self.node.events.log(DeadLetter(ref, m, sender))
         self.parent_actor.send(('_child_terminated', ref))
         for watcher in (self.watchers or []):
             watcher << ('terminated', ref)
-        self.actor = self.inbox = self.queue = self.parent_actor = None
+        self.actor = self.mailbox = self.parent_actor = self.context = None
 
     def unhandled(self, m, sender):
         if ('terminated', ANY) == m:
             raise UnhandledTermination(watcher=self.ref, watchee=m[1])
         else:
-            Events.log(UnhandledMessage(self.ref, m, sender))
+            self.node.events.log(UnhandledMessage(self.ref, m, sender))
 
     @logstring("report")
     def report(self, exc_and_tb=None):
@@ -375,7 +457,7 @@ class Cell(Greenlet, _BaseCell):
             print(exc_fmt.strip(), file=sys.stderr)
         else:
             fail("Died because a watched actor (%r) died" % (exc.watchee,))
-        Events.log(Error(self.ref, exc, tb)),
+        self.node.events.log(Error(self.ref, exc, tb))
 
     def watch(self, actor, *actors, **kwargs):
         actors = (actor,) + actors
@@ -421,13 +503,6 @@ class Cell(Greenlet, _BaseCell):
 
     # misc
 
-    @property
-    def ref(self):
-        if not self._ref or not self._ref():
-            ref = Ref(cell=self, uri=self.uri, node=self.node)  # must store in a temporary variable to avoid immediate collection
-            self._ref = weakref.ref(ref)
-        return self._ref()
-
     @property
     def root(self):
         from spinoff.actor.guardian import Guardian
@@ -439,9 +514,9 @@ class Cell(Greenlet, _BaseCell):
     #     return {'--\\': self.shutting_down, '+': self.stopped, 'N': not self.started, '_': self.suspended, '?': self.tainted, 'X': self.processing_messages, }
 
     # def logcomment(self):  # pragma: no cover
-    #     if not self.queue.empty() or self.inbox:
+    #     if self.mailbox:
     #         def g():
-    #             for i, msg in enumerate(chain(self.inbox, [' ... '], self.queue.queue)):
+    #             for i, msg in enumerate(chain(self.mailbox.system, [' ... '], self.mailbox.letters)):
     #                 yield msg if isinstance(msg, str) else repr(msg)
     #                 if i == 2:
     #                     yield '...'
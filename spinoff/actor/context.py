@@ -2,20 +2,22 @@ from gevent import getcurrent
 
 
 def get_context():
-    curr = getcurrent()
-    try:
-        cell = curr._cell
-    except AttributeError:
-        if hasattr(curr, 'spawn_actor'):
-            cell = curr
-        else:
-            return None
-    # give out the method, not the cell object itself, to avoid exposing the internals
-    return Context(cell)
+    # the dispatcher workers and the helper greenlets of the actors point to the cell they're currently running
+    cell = getattr(getcurrent(), '_cell', None)
+    if cell is None:
+        return None
+    # the context is created once per cell; the cell keeps its `sender` up to date
+    context = cell.context
+    if context is None:
+        context = cell.context = Context(cell)
+    return context
 
 
 class Context(object):
+    __slots__ = ('spawn', 'sender', 'node', 'ref')
+
     def __init__(self, cell):
+        # give out the method, not the cell object itself, to avoid exposing the internals
         self.spawn = cell.spawn_actor
         self.sender = cell.actor.sender if cell.actor else None
         self.node = cell.node
@@ -0,0 +1,87 @@
+# coding: utf-8
+from __future__ import print_function
+
+from collections import deque
+
+import gevent
+from gevent.hub import Waiter, get_hub, getcurrent
+
+
+class Dispatcher(object):
+    """Runs the cells that have something to do on a shared pool of worker greenlets.
+
+    Cells don't own a greenlet: an idle cell is just a `Mailbox` and an actor, and it only gets scheduled once something
+    is put in its mailbox. A worker runs one `Cell.step` at a time, which processes at most `Cell.throughput` letters,
+    and puts the cell back at the end of the queue if it has more to do. As long as there are cells waiting, the worker
+    yields to the hub after each step, so that busy actors can't starve timers, heartbeats and sockets.
+
+    A worker that blocks (e.g. in a `receive` that waits for something) keeps its cell and simply stays busy; whenever
+    the hub gets control while there are cells waiting, an idle worker is woken up, or a new one is spawned if there is
+    none, so a blocked actor never holds up any others. At most `max_idle` workers are kept around when there is
+    nothing to do.
+
+    """
+    max_idle = 4
+
+    def __init__(self):
+        self.ready = deque()
+        self.idle = []
+        self.workers = 0
+        self.starting = 0
+        self.kicking = False
+
+    def schedule(self, cell):
+        self.ready.append(cell)
+        if not self.kicking:
+            self._kick()
+
+    def _kick(self):
+        self.kicking = True
+        get_hub().loop.run_callback(self._wake)
+
+    def _wake(self):
+        # only ever called from the hub, i.e. when all the busy workers are either blocked or have yielded
+        self.kicking = False
+        ready, idle = self.ready, self.idle
+        while ready and idle:
+            idle.pop().switch(None)
+        if ready and not self.starting:
+            self.workers += 1
+            self.starting += 1
+            gevent.spawn(self._work)
+
+    def _work(self):
+        self.starting -= 1
+        current, ready, idle = getcurrent(), self.ready, self.idle
+        try:
+            while True:
+                while ready:
+                    cell = ready.popleft()
+                    # if this cell blocks, another worker has to take over the rest of the queue
+                    if ready and not self.kicking:
+                        self._kick()
+                    current._cell = cell
+                    try:
+                        if cell.step():
+                            ready.append(cell)
+                    except Exception:
+                        # a failure of the cell itself; losing the worker would leave the cell scheduled for good
+                        cell.crash()
+                    finally:
+                        current._cell = cell = None
+                    if ready:
+                        # gives the hub a chance to run the timers and I/O between the quanta of busy cells
+                        gevent.sleep(0)
+                if len(idle) >= self.max_idle:
+                    return
+                waiter = Waiter()
+                idle.append(waiter)
+                waiter.get()
+        finally:
+            self.workers -= 1
+
+    def __repr__(self):
+        return "<dispatcher:%d ready, %d/%d idle workers>" % (len(self.ready), len(self.idle), self.workers)
+
+
+dispatcher = Dispatcher()
@@ -1,10 +1,14 @@
 from __future__ import print_function
 
 import sys
+import time
 import traceback
 from collections import namedtuple
 
 from gevent.event import AsyncResult
+from gevent.hub import get_hub
+from spinoff.actor.uri import Uri
+from spinoff.util.pattern_matching import LITERAL_TYPES
 from spinoff.util.logging import err, log, fail
 
 
@@ -13,6 +17,11 @@ def fields(*args):
 
 
 class Event(object):
+    __slots__ = ()
+
+    # whether the logging of the event can be limited by the `Throttle` of the `EventBus`
+    throttled = False
+
     def __repr__(self):
         return '%s(%s)' % (type(self).__name__, self.repr_args())
 
@@ -21,6 +30,9 @@ class Event(object):
 
 
 class UnhandledMessage(Event, fields('actor', 'message', 'sender')):
+    __slots__ = ()
+    throttled = True
+
     def repr_args(self):  # pragma: no cover
         r = repr(self.message)
         if len(r) > 200:
@@ -30,6 +42,9 @@ class UnhandledMessage(Event, fields('actor', 'message', 'sender')):
 
 
 class DeadLetter(Event, fields('actor', 'message', 'sender')):
+    __slots__ = ()
+    throttled = True
+
     def repr_args(self):
         r = repr(self.message)
         if len(r) > 200:
@@ -39,6 +54,8 @@ class DeadLetter(Event, fields('actor', 'message', 'sender')):
 
 class Error(Event, fields('actor', 'exc', 'tb')):
     """Logged by actors as they run into errors."""
+    __slots__ = ()
+
     def repr_args(self):  # pragma: no cover
         try:
             formatted_traceback = '\n' + traceback.format_exception(self.exc, None, self.tb)
@@ -48,53 +65,182 @@ class Error(Event, fields('actor', 'exc', 'tb')):
 
 
 class Terminated(Event, fields('actor')):
-    pass
+    __slots__ = ()
+
+
+class Throttle(object):
+    """Limits how many events of the same kind get logged in full, e.g. during a network partition or a crash loop.
+
+    Events are grouped by their type, the path of their actor and the tag of their message (or the message itself if
+    not a tuple, or its type if not a literal). Only the first `burst` events of each group per `window` seconds are
+    logged; the rest are merely counted, without ever being formatted, and summarised in one line per group at the end
+    of the window. At most `max_groups` groups are tracked per window; any further events are counted together.
+
+    """
+    window = 1.0
+    burst = 10
+    max_groups = 1000
+
+    def __init__(self, window=None, burst=None):
+        if window is not None:
+            self.window = window
+        if burst is not None:
+            self.burst = burst
+        self.counts = {}
+        self.suppressed = 0  # the total number of events not logged, ever
+        self._started = None
+        self._timer = None
+
+    def allow(self, event):
+        """Returns `False` if `event` should not be logged."""
+        now = time.time()
+        if self._started is None or now - self._started >= self.window:
+            if self.counts:
+                self.flush()
+            self._started = now
+        counts = self.counts
+        key = (type(event), _path_of(event.actor), _tag_of(event.message))
+        n = counts.get(key)
+        if n is None and len(counts) >= self.max_groups:
+            key, n = (type(event), '*', '*'), counts.get((type(event), '*', '*'))
+        counts[key] = n = (n or 0) + 1
+        if n <= self.burst:
+            return True
+        self.suppressed += 1
+        if self._timer is None:
+            # makes sure the summary gets logged even if no more events come
+            self._timer = get_hub().loop.timer(max(self._started + self.window - now, 0))
+            self._timer.start(self.flush)
+        return False
+
+    def flush(self):
+        """Logs the summaries of the events suppressed in the current window and starts a new window."""
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        counts, self.counts, self._started = self.counts, {}, None
+        for (event_type, path, tag), n in sorted(counts.items()):
+            if n > self.burst:
+                log("%d more %s events for %s with message %r in the last %ss" % (
+                    n - self.burst, event_type.__name__, path, tag, self.window))
+
+    def __repr__(self):
+        return "<throttle:%d groups, %d suppressed>" % (len(self.counts), self.suppressed)
+
+
+class EventBus(object):
+    """The event bus: logs every event and hands it to the matching consumers and subscribers.
+
+    Subscriptions are by event class, and include the subclasses of that class, so subscribing to `Event` gets all the
+    events; they can further be limited to the events of the actors under a given path. The subscribers relevant to
+    each concrete event class are worked out once and cached until the subscriptions change, so logging an event that
+    nobody listens to costs no more than a couple of dict lookups on top of the log write.
 
+    Every `Node` has its own `EventBus` so that the subscribers of one node don't get the events of the other nodes in
+    the same process; the events of all nodes are additionally passed on to the process-wide `Events`, which is what
+    the buses of the nodes have as their `parent`. An event taken by a consumer goes no further.
 
-class Events(object):
-    # TODO: add {event type} + {actor / actor path} based subscriptions.
+    The logging (but not the delivery) of the events that are prone to flooding, such as `DeadLetter`s, is limited by
+    the `throttle`, which can be set to `None` to log every event in full.
 
-    subscriptions = {}
-    consumers = {}
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.throttle = Throttle()
+        self.reset()
 
     def log(self, event, log_caller=False):
         try:
-            (fail if isinstance(event, Error) else log)(event, caller=log_caller)
-
-            consumers = self.consumers.get(type(event))
-            if consumers:
-                consumer_d = consumers.pop(0)
-                consumer_d.set(event)
-                return
-
-            subscriptions = self.subscriptions.get(type(event))
-            if subscriptions:
-                for fn in subscriptions:
-                    try:
-                        fn(event)
-                    except Exception:  # pragma: no cover
-                        err("Error in event handler:\n", traceback.format_exc())
+            if not event.throttled or self.throttle is None or self.throttle.allow(event):
+                (fail if isinstance(event, Error) else log)(event, caller=log_caller)
+            events = self
+            while events is not None and not events._deliver(event):
+                events = events.parent
         except Exception:  # pragma: no cover
             print("Events.log failed:\n", traceback.format_exc(), file=sys.stderr)
 
-    def subscribe(self, event_type, fn):
-        self.subscriptions.setdefault(event_type, []).append(fn)
-
-    def unsubscribe(self, event_type, fn):
+    def _deliver(self, event):
+        # returns `True` if the event was consumed
+        cls = type(event)
+        if self.consumers:
+            for t in cls.__mro__:
+                consumers = self.consumers.get(t)
+                while consumers:
+                    consumer_d = consumers.pop(0)
+                    if not consumer_d.ready():  # might have been registered for more than one event type
+                        consumer_d.set(event)
+                        return True
+
+        subscriptions = self._dispatch.get(cls)
+        if subscriptions is None:
+            subscriptions = self._dispatch[cls] = self._subscriptions_of(cls)
+        if subscriptions:
+            path = None
+            for fn, prefix in subscriptions:
+                if prefix is not None:
+                    if path is None:
+                        path = _path_of(event.actor)
+                    if not (path == prefix or path.startswith(prefix + '/')):
+                        continue
+                try:
+                    fn(event)
+                except Exception:  # pragma: no cover
+                    err("Error in event handler:\n", traceback.format_exc())
+        return False
+
+    def subscribe(self, event_type, fn, under=None):
+        """Calls `fn` with every event of type `event_type`, including its subclasses.
+
+        If `under` is given as a path, `Uri` or `Ref`, only the events of that actor and its descendants are passed on.
+
+        """
+        self.subscriptions.setdefault(event_type, []).append((fn, _path_of(under) if under is not None else None))
+        self._dispatch.clear()
+
+    def unsubscribe(self, event_type, fn, under=None):
         subscribers = self.subscriptions.get(event_type, [])
-        if fn in subscribers:
-            subscribers.remove(fn)
+        subscription = (fn, _path_of(under) if under is not None else None)
+        if subscription in subscribers:
+            subscribers.remove(subscription)
+            if not subscribers:
+                del self.subscriptions[event_type]
+            self._dispatch.clear()
+
+    def _subscriptions_of(self, cls):
+        return tuple(subscription for t in cls.__mro__ for subscription in self.subscriptions.get(t, ()))
 
     def consume_one(self, event_type):
         assert isinstance(event_type, type) or all(isinstance(x, type) for x in event_type)
         ret = AsyncResult()
-        self.consumers.setdefault(event_type, []).append(ret)
+        for t in (event_type if isinstance(event_type, tuple) else (event_type,)):
+            self.consumers.setdefault(t, []).append(ret)
         return ret
 
     def reset(self):
         self.subscriptions = {}
         self.consumers = {}
+        # the subscriptions relevant to each concrete event type
+        self._dispatch = {}
 
     def __repr__(self):
-        return "<Events>"
-Events = Events()
+        return "<Events>" if self is Events else "<EventBus>"
+
+
+def _path_of(actor):
+    if isinstance(actor, str):
+        try:
+            return Uri.parse(actor).path if actor else ''
+        except ValueError:
+            return ''  # not a URI, so the event has no path
+    uri = getattr(actor, 'uri', None)
+    return uri.path if uri is not None else str(actor)
+
+
+def _tag_of(message):
+    if isinstance(message, tuple):
+        return message[0] if message and isinstance(message[0], LITERAL_TYPES) else type(message).__name__
+    return message if isinstance(message, LITERAL_TYPES) else type(message).__name__
+
+
+# the process-wide event bus, which gets the events of all nodes
+Events = EventBus()
@@ -5,7 +5,7 @@ from pickle import PicklingError
 
 import gevent
 from spinoff.actor.cell import _BaseCell
-from spinoff.actor.events import Events, UnhandledMessage
+from spinoff.actor.events import UnhandledMessage
 from spinoff.actor.ref import _BaseRef
 from spinoff.actor.context import get_context
 from spinoff.util.pattern_matching import ANY
@@ -35,11 +35,24 @@ class Guardian(_BaseCell, _BaseRef):
         self.root = self
         self._cell = self  # for _BaseCell
         self.all_children_stopped = None
+        # all of the live cells of the hierarchy by their path; maintained by the cells themselves as they're spawned
+        # and destroyed, so that looking up a cell doesn't have to walk the hierarchy
+        self.cells = {}
 
     @property
     def ref(self):
         return self
 
+    def lookup_cell(self, uri):
+        path = uri.path
+        if path and path[0] != '/':
+            path = '/' + path  # relative to the guardian
+        return self.lookup_path(path)
+
+    def lookup_path(self, path):
+        """Looks up a local cell by its absolute path; returns `None` if there's no such cell."""
+        return self.cells.get(path) if path else self
+
     def send(self, message, _sender=None):
         if ('_child_terminated', ANY) == message:
             _, sender = message
@@ -59,7 +72,7 @@ class Guardian(_BaseCell, _BaseRef):
                 context = get_context()
                 if context:
                     _sender = context.ref
-            Events.log(UnhandledMessage(self, message, _sender))
+            self.node.events.log(UnhandledMessage(self, message, _sender))
 
     receive = send
 
@@ -0,0 +1,70 @@
+# coding: utf-8
+from __future__ import print_function
+
+import types
+from itertools import count
+
+from spinoff.actor.exceptions import Unhandled
+from spinoff.util.pattern_matching import PatternTable
+
+
+_order = count()
+
+
+def on(*patterns):
+    """Marks a method of an actor as the handler of the messages matching any of the given `patterns`.
+
+    The handlers are used by a `receive` created by `dispatch`, which calls the handler of the first pattern, in the
+    order of definition, that matches the message:
+
+        class MyActor(Actor):
+            @on(('ping', ANY))
+            def ping(self, message):
+                ...
+
+            @on('stop', ('stop', ANY))
+            def stop(self, message):
+                ...
+
+            receive = dispatch()
+
+    """
+    def decorate(fn):
+        fn._patterns, fn._order = patterns, next(_order)
+        return fn
+    return decorate
+
+
+def dispatch():
+    """Returns a `receive` method that dispatches messages to the `on` handlers of the actor.
+
+    The patterns are compiled into a `PatternTable` once per actor class, so dispatching a message takes (mostly) one
+    dict lookup regardless of the number of handlers. Messages matching no handler are unhandled.
+
+    """
+    tables = {}
+
+    def receive(self, message):
+        cls = self.__class__
+        table = tables.get(cls)
+        if table is None:
+            table = tables[cls] = _compile(cls)
+        handler = table.find(message)
+        if handler is None:
+            raise Unhandled
+        handler(self, message)
+    return receive
+
+
+def _compile(cls):
+    # walk the MRO from the base down so that overriding a handler in a subclass replaces it, even if not decorated
+    handlers = {}
+    for klass in reversed(cls.__mro__):
+        for name, fn in vars(klass).items():
+            if isinstance(fn, types.FunctionType) and hasattr(fn, '_patterns'):
+                handlers[name] = fn
+            else:
+                handlers.pop(name, None)
+    return PatternTable((pattern, fn)
+                        for fn in sorted(handlers.values(), key=lambda fn: fn._order)
+                        for pattern in fn._patterns)
@@ -0,0 +1,227 @@
+# coding: utf-8
+from __future__ import print_function
+
+from collections import deque
+from itertools import count
+
+from gevent.hub import Waiter, get_hub, getcurrent
+
+from spinoff.actor.dispatcher import dispatcher
+from spinoff.util.pattern_matching import LITERAL_TYPES
+from spinoff.util.python import enumrange
+
+
+# what to do with a letter that arrives when a bounded `Mailbox` is full:
+#  * BLOCK: block the sending actor until there is room (or the mailbox is closed); other greenlets, such as the ones
+#    of the `Hub`, can't be held up, so their letters are rejected as with DEAD_LETTER;
+#  * DROP_NEWEST: discard the arriving letter;
+#  * DROP_OLDEST: discard the oldest pending letter to make room for the arriving one;
+#  * DEAD_LETTER: reject the arriving letter so that it ends up as a `DeadLetter`.
+OVERFLOW_POLICIES = BLOCK, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER = enumrange('BLOCK', 'DROP_NEWEST', 'DROP_OLDEST', 'DEAD_LETTER')
+
+# the number of times each overflow policy has been applied, process wide
+overflows = dict.fromkeys(OVERFLOW_POLICIES, 0)
+
+
+def check_options(capacity, overflow):
+    """Raises `TypeError` unless `capacity` and `overflow` are valid for a `Mailbox`."""
+    if capacity is not None and not (isinstance(capacity, int) and capacity > 0):
+        raise TypeError("mailbox capacity should be a positive integer")
+    if overflow not in OVERFLOW_POLICIES:
+        raise TypeError("mailbox overflow policy should be one of %s" % (', '.join(map(str, OVERFLOW_POLICIES)),))
+
+
+class Mailbox(object):
+    """The message queue of a `Cell`.
+
+    Letters, i.e. `(sender, message)` pairs, and system messages, i.e. `(tag, arg)` pairs, are kept in separate lanes
+    so that the system messages can be handled before any pending letters. Both lanes are plain `deque`s that the owner
+    of the `Mailbox` consumes directly. Putting something in an idle `Mailbox` schedules its owner on the `Dispatcher`,
+    unless the owner is blocked in `wait`, which is the only blocking operation.
+
+    If a `capacity` is given, at most that many letters are kept pending, and the `overflow` policy decides what happens
+    with the letters that arrive on top of that. System messages and `('terminated', ref)` notices are never limited,
+    nor dropped to make room. The owner has to call `release` after consuming letters so that any senders blocked by
+    the `BLOCK` policy can continue.
+
+    """
+    __slots__ = ('owner', 'letters', 'system', 'capacity', 'overflow', 'overflows', 'blocked', 'closed', 'scheduled',
+                 '_waiter')
+
+    def __init__(self, owner=None, capacity=None, overflow=BLOCK):
+        check_options(capacity, overflow)
+        self.owner = owner
+        self.letters = deque()
+        self.system = deque()
+        self.capacity = capacity
+        self.overflow = overflow
+        self.overflows = 0
+        self.blocked = None  # the waiters of the blocked senders; only allocated once a sender is blocked
+        self.closed = self.scheduled = False
+        self._waiter = None
+
+    def put(self, sender, message):
+        """Puts a letter in the `Mailbox`; returns `False` if the letter was rejected or dropped instead."""
+        if (self.capacity is not None and len(self.letters) >= self.capacity and not _is_notice(message) and
+                not self._overflow()):
+            return False
+        self.letters.append((sender, message))
+        if self._waiter is not None:
+            self._wake()
+        elif not self.scheduled:
+            self.schedule()
+        return True
+
+    def _overflow(self):
+        policy = self.overflow
+        if policy is BLOCK:
+            cell = getattr(getcurrent(), '_cell', None)
+            if cell is not None and cell is self.owner:  # the owner blocking itself would never consume the letters
+                return True
+            overflows[policy] += 1
+            self.overflows += 1
+            if cell is None:  # not an actor; whatever else the greenlet does would be held up as well
+                return False
+            if self.blocked is None:
+                self.blocked = deque()
+            while not self.closed and len(self.letters) >= self.capacity:
+                waiter = Waiter()
+                self.blocked.append(waiter)
+                try:
+                    waiter.get()
+                finally:
+                    if waiter in self.blocked:
+                        self.blocked.remove(waiter)
+            return not self.closed
+        overflows[policy] += 1
+        self.overflows += 1
+        if policy is DROP_OLDEST:
+            letters = self.letters
+            for ix, (_, message) in enumerate(letters):
+                if not _is_notice(message):
+                    del letters[ix]
+                    return True
+        return False
+
+    def put_system(self, tag, arg=None):
+        self.system.append((tag, arg))
+        if self._waiter is not None:
+            self._wake()
+        elif not self.scheduled:
+            self.schedule()
+
+    def schedule(self):
+        """Has the owner run by the `Dispatcher`; it stays `scheduled` until it reports to have nothing more to do."""
+        self.scheduled = True
+        dispatcher.schedule(self.owner)
+
+    def wait(self):
+        """Blocks until the next letter or system message is put in the `Mailbox`."""
+        self._waiter = waiter = Waiter()
+        try:
+            waiter.get()
+        finally:
+            self._waiter = None
+
+    def _wake(self):
+        waiter, self._waiter = self._waiter, None
+        get_hub().loop.run_callback(waiter.switch, None)
+
+    def release(self):
+        """Wakes up as many of the blocked senders as there is room for in the `Mailbox`."""
+        blocked, run_callback = self.blocked, get_hub().loop.run_callback
+        for _ in xrange(min(len(blocked), self.capacity - len(self.letters))):
+            run_callback(blocked.popleft().switch, None)
+
+    def close(self):
+        """Wakes up all blocked senders; their letters are rejected from now on."""
+        self.closed = True
+        while self.blocked:
+            get_hub().loop.run_callback(self.blocked.popleft().switch, None)
+
+    def __len__(self):
+        return len(self.letters) + len(self.system)
+
+    def __repr__(self):
+        return "<mailbox:%d+%d>" % (len(self.system), len(self.letters))
+
+
+def _is_notice(message):
+    # the watchers of an actor must not miss its termination, whatever the state of their mailboxes
+    return message.__class__ is tuple and len(message) == 2 and message[0] == 'terminated'
+
+
+# the bucket of the letters and patterns that can't be told apart by their tag or value
+_OTHER = object()
+
+
+def _bucket_key(x):
+    if isinstance(x, tuple):
+        return (len(x), x[0] if x and isinstance(x[0], LITERAL_TYPES) else _OTHER)
+    return x if isinstance(x, LITERAL_TYPES) else _OTHER
+
+
+class Stash(object):
+    """The letters put aside by a `run()` actor because they didn't match the pattern it was waiting for.
+
+    The letters are bucketed by their arity and tag (or value if not a tuple), so finding the first letter matching a
+    pattern only has to look at the buckets the pattern can possibly match instead of at every stashed letter.
+
+    """
+    __slots__ = ('buckets', '_seq')
+
+    def __init__(self):
+        self.buckets = {}
+        self._seq = count()
+
+    def append(self, sender, message):
+        key = _bucket_key(message)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = deque()
+        bucket.append((next(self._seq), sender, message))
+
+    def pop_match(self, pattern):
+        """Removes and returns the earliest stashed `(sender, message)` matching `pattern`, or `None` if there's none."""
+        buckets = self.buckets
+        if isinstance(pattern, tuple) and pattern and isinstance(pattern[0], LITERAL_TYPES):
+            keys = [(len(pattern), pattern[0]), (len(pattern), _OTHER)]
+        elif isinstance(pattern, tuple):
+            keys = [key for key in buckets if isinstance(key, tuple) and key[0] == len(pattern)]
+        elif isinstance(pattern, LITERAL_TYPES):
+            keys = [pattern, _OTHER]
+        else:
+            keys = list(buckets)
+        found = found_key = found_ix = None
+        for key in keys:
+            bucket = buckets.get(key)
+            if not bucket:
+                continue
+            for ix, entry in enumerate(bucket):
+                if found is not None and entry[0] > found[0]:
+                    break
+                if pattern == entry[2]:
+                    found, found_key, found_ix = entry, key, ix
+                    break
+        if found is None:
+            return None
+        bucket = buckets[found_key]
+        del bucket[found_ix]
+        if not bucket:
+            del buckets[found_key]
+        return found[1:]
+
+    def popall(self):
+        """Removes and returns all of the stashed `(sender, message)`s in the order they were stashed."""
+        entries = sorted(entry for bucket in self.buckets.values() for entry in bucket)
+        self.buckets.clear()
+        return [entry[1:] for entry in entries]
+
+    def __nonzero__(self):
+        return bool(self.buckets)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def __repr__(self):
+        return "<stash:%d>" % (len(self),)
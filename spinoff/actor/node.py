@@ -1,18 +1,18 @@
 # coding: utf-8
 from __future__ import print_function
 
-from cPickle import dumps, PicklingError
-from cStringIO import StringIO
+import traceback
+from cPickle import PicklingError
 
-from spinoff.actor.events import Events, DeadLetter
+from spinoff.actor.events import Events, EventBus, DeadLetter
 from spinoff.actor.exceptions import LookupFailed
 from spinoff.actor.guardian import Guardian
 from spinoff.actor.ref import Ref
 from spinoff.actor.uri import Uri
 from spinoff.remoting import Hub, HubWithNoRemoting
-from spinoff.remoting.pickler import IncomingMessageUnpickler
+from spinoff.remoting import envelope
 from spinoff.util.pattern_matching import ANY
-from spinoff.util.logging import err
+from spinoff.util.logging import err, fail, set_production
 
 
 class Node(object):
@@ -24,8 +24,15 @@ class Node(object):
     """
     _hub = None
 
-    def __init__(self, nid=None, enable_remoting=False, enable_relay=False, hub_kwargs={}):
+    def __init__(self, nid=None, enable_remoting=False, enable_relay=False, hub_kwargs={}, production=False,
+                 codec=envelope.DEFAULT_CODEC):
+        if production:
+            set_production()  # applies to the whole process, as does logging
         self.nid = nid
+        # encodes the messages sent to other nodes; the receiving nodes need to have it registered as well
+        self.codec = codec
+        # the events of this node only; they're passed on to the process-wide `Events` as well
+        self.events = EventBus(parent=Events)
         self._uri = Uri(name=None, parent=None, node=nid)
         self.guardian = Guardian(uri=self._uri, node=self)
         self._hub = (
@@ -56,7 +63,7 @@ class Node(object):
         return self.guardian.spawn_actor(*args, **kwargs)
 
     def send_message(self, message, remote_ref, sender):
-        self._hub.send_message(remote_ref.uri.node, _Msg(remote_ref, message, sender))
+        self._hub.send_message(remote_ref.uri.node, _Msg(remote_ref, message, sender, self.codec))
 
     def watch_node(self, nid, watcher):
         self._hub.watch_node(nid, watcher)
@@ -64,19 +71,28 @@ class Node(object):
     def unwatch_node(self, nid, watcher):
         self._hub.unwatch_node(nid, watcher)
 
-    def _on_receive(self, sender_nid, msg_bytes):
-        pickler = IncomingMessageUnpickler(self, StringIO(msg_bytes))
+    def _on_receive(self, sender_nid, msg_bytes, names):
+        # the recipient is looked up before the message itself is decoded
         try:
-            loaded = pickler.load()
-        except Exception:
-            return  # malformed input
+            local_path, sender_uri, codec, offset = envelope.decode_header(msg_bytes, names)
+        except envelope.UnknownId as e:
+            # the sender might not have noticed us restarting, or a definition got lost; either way, it has to define
+            # its IDs anew for the messages to come, and this one can't be delivered
+            self._hub.unknown_ids_from(sender_nid)
+            self._undeliverable(sender_nid, msg_bytes, e)
+            return
+        except ValueError:
+            fail("Dropped a malformed message from %s" % (sender_nid,))
+            return
+        cell = self.guardian.lookup_path(local_path)
 
         try:
-            local_path, message, sender = loaded
+            message, sender = envelope.decode_message(self, msg_bytes, sender_uri, codec, offset)
         except Exception:
-            return  # malformed input
+            fail("Dropped a message to %s from %s that couldn't be decoded:\n%s"
+                 % (local_path, sender_nid, traceback.format_exc()))
+            return
 
-        cell = self.guardian.lookup_cell(Uri.parse(local_path))
         if not cell:
             if ('_watched', ANY) == message:
                 watched_ref = Ref(cell=None, node=self, uri=Uri.parse(self.nid + local_path), is_local=True)
@@ -89,10 +105,20 @@ class Node(object):
         else:
             cell.receive(message, sender)
 
+    def _undeliverable(self, sender_nid, msg_bytes, unknown_id):
+        # with its path unknown, all that is known about the recipient is that it's on this node
+        try:
+            message, sender = envelope.decode_message(
+                self, msg_bytes, unknown_id.sender_uri, unknown_id.codec, unknown_id.offset)
+        except Exception:
+            fail("Dropped a message from %s that couldn't be decoded:\n%s" % (sender_nid, traceback.format_exc()))
+            return
+        self._remote_dead_letter(unknown_id.path or '', message, sender)
+
     def _remote_dead_letter(self, path, msg, sender):
         ref = Ref(cell=None, uri=Uri.parse(self.nid + path), node=self, is_local=True)
         if not (msg == ('_unwatched', ANY) or msg == ('_watched', ANY)):
-            Events.log(DeadLetter(ref, msg, sender))
+            self.events.log(DeadLetter(ref, msg, sender))
 
     def stop(self):
         if getattr(self, 'guardian', None):
@@ -114,15 +140,19 @@ class Node(object):
 
 
 class _Msg(object):
-    def __init__(self, ref, msg, sender):
+    def __init__(self, ref, msg, sender, codec=envelope.DEFAULT_CODEC):
         self.ref, self.msg, self.sender = ref, msg, sender
+        # encoded right away so that unencodable messages fail the sending and not the `Hub`; the header is only put
+        # together when sending, as the IDs of the path and the sender URI depend on what was sent before
+        self._path, self._sender_uri, self._rest = envelope.encode_parts(ref.uri.path, msg, sender, codec)
 
-    def serialize(self):
-        return dumps((self.ref.uri.path, self.msg, self.sender), protocol=2)
+    def serialize(self, ids=None):
+        """Returns the envelope of the message, with the path and sender URI given by `ids` if provided."""
+        return envelope.header(self._path, self._sender_uri, ids) + self._rest
 
     def send_failed(self):
         if not (self.msg == ('_unwatched', ANY) or self.msg == ('_watched', ANY)):
-            Events.log(DeadLetter(self.ref, self.msg, self.sender))
+            self.ref.node.events.log(DeadLetter(self.ref, self.msg, self.sender))
 
     def __repr__(self):
         return "_Msg(%r, %r, %r)" % (self.ref, self.msg, self.sender)
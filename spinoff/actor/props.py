@@ -3,10 +3,33 @@ from __future__ import print_function
 
 import inspect
 
+from spinoff.actor.mailbox import BLOCK, check_options
+
 
 # TODO: rename to _UnspawnedActor
 class Props(object):
+    """Describes how to create an actor: its class and constructor arguments.
+
+    Keyword arguments starting with an underscore are not passed to the constructor but configure the actor's cell
+    instead, and override the corresponding class attribute of the actor:
+
+    * `_throughput`: the max. number of messages the actor processes in one go before letting other actors run;
+    * `_mailbox_capacity`: the max. number of messages pending in the mailbox of the actor; unbounded by default;
+    * `_mailbox_overflow`: what to do with the messages that arrive when the mailbox is full: one of `BLOCK` (the
+      default; only actors are blocked, the messages from anywhere else are rejected), `DROP_NEWEST`, `DROP_OLDEST` or
+      `DEAD_LETTER` from `spinoff.actor.mailbox`.
+
+    """
+    _OPTIONS = ('throughput', 'mailbox_capacity', 'mailbox_overflow')
+
     def __init__(self, cls, *args, **kwargs):
+        for name in self._OPTIONS:
+            value = kwargs.pop('_' + name, None)
+            setattr(self, name, getattr(cls, name, None) if value is None else value)
+        if self.throughput is not None and not (isinstance(self.throughput, int) and self.throughput > 0):
+            raise TypeError("throughput should be a positive integer")
+        # validated right away, so that a misconfigured actor fails where it's described and not when spawned
+        check_options(self.mailbox_capacity, BLOCK if self.mailbox_overflow is None else self.mailbox_overflow)
         if hasattr(inspect, 'getcallargs'):
             inspect.getcallargs(cls.__init__, None, *args, **kwargs)
         self.cls, self.args, self.kwargs = cls, args, kwargs
@@ -15,8 +38,10 @@ class Props(object):
         return self.cls(*self.args, **self.kwargs)
 
     def using(self, *args, **kwargs):
-        args += args
+        args = self.args + args
         kwargs.update(self.kwargs)
+        for name in self._OPTIONS:
+            kwargs.setdefault('_' + name, getattr(self, name))
         return Props(self.cls, *args, **kwargs)
 
     def __repr__(self):
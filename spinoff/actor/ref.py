@@ -16,6 +16,7 @@ from spinoff.util.logging import dbg
 class _BaseRef(object):
     """Internal abstract class for all objects that behave like actor references."""
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     @abc.abstractproperty
     def is_local(self):
@@ -40,8 +41,7 @@ class _BaseRef(object):
             return self._cell.lookup_ref(next)
         # non-local or dead
         else:
-            return Ref(cell=None, uri=self.uri / next, is_local=self.is_local,
-                       node=None if self.is_local else self.node)
+            return Ref(cell=None, uri=self.uri / next, is_local=self.is_local, node=self.node)
 
     def __lshift__(self, message):
         """A fancy looking alias to `_BaseRef.stop`, which in addition also supports chaining.
@@ -119,14 +119,10 @@ class Ref(_BaseRef):
 
     """
 
-    _cell = None
-
-    # XXX: should be is_resolved with perhaps is_local being None while is_resolved is False
+    # XXX: is_local should be is_resolved with perhaps is_local being None while is_resolved is False
     # Ref constructor should set is_resolved=False by default, but that requires is_dead for creating dead refs, because
     # currently dead refs are just Refs with no cell and is_local=True
-    is_local = True
-    uri = None
-    node = None
+    __slots__ = ('_cell', 'uri', 'node', 'is_local', '__weakref__')
 
     def __init__(self, cell, uri, node, is_local=True):
         assert is_local or not cell
@@ -140,7 +136,7 @@ class Ref(_BaseRef):
         """Sends a message to the actor represented by this `Ref`."""
         if not _sender:
             context = get_context()
-            if context:
+            if context is not None:
                 _sender = context.ref
         if self._cell:
             if not self._cell.stopped:
@@ -167,7 +163,7 @@ class Ref(_BaseRef):
                   message == '_stop' or message == '_kill' or message == '__done'):
                 pass
             else:
-                Events.log(DeadLetter(self, message, _sender))
+                (self.node.events if self.node else Events).log(DeadLetter(self, message, _sender))
 
     @property
     def is_stopped(self):
@@ -211,6 +207,8 @@ class Ref(_BaseRef):
     def __setstate__(self, uri):
         # if it's a tuple, it's a remote `Ref` and the tuple origates from IncomingMessageUnpickler,
         # otherwise it must be just a local `Ref` being pickled and unpickled for whatever reason:
+        self._cell = self.node = None
+        self.is_local = True
         if isinstance(uri, tuple):
             self.is_local = False
             uri, self.node = uri
@@ -1,5 +1,3 @@
-from collections import deque
-
 from spinoff.util.pattern_matching import Matcher
 from spinoff.actor.validate import _validate_nodeid
 
@@ -11,27 +9,46 @@ class Uri(object):
     used **only** as a path separator. Thus, both of the name and path path of the root `Uri` are `''`, and the steps
     are `['']`. The root `Uri` is also only `__eq__` to `''` and not `'/'`.
 
+    `Uri`s are immutable: the `node`, `path`, string representation and hash are computed once when the `Uri` is
+    created, so comparing and hashing them is as cheap as comparing and hashing `str`s.
+
     """
-    _node = None
+    __slots__ = ('name', 'parent', 'node', 'path', '_str', '_hash')
+
+    # `Uri.parse` results are cached so that `Uri`s parsed from the same `str` are usually the same object
+    _parsed = {}
+    _max_parsed = 10000
 
     def __init__(self, name, parent, node=None):
         if name and node:
             raise TypeError("node specified for a non-root Uri")  # pragma: no cover
-        self.name, self.parent = name, parent
-        if node:
-            _validate_nodeid(node)
-            self._node = node
+        if parent:
+            node, path = parent.node, parent.path + '/' + name
+        else:
+            if node:
+                _validate_nodeid(node)
+            node, path = node or None, name or ''
+        _set = object.__setattr__
+        _set(self, 'name', name)
+        _set(self, 'parent', parent)
+        _set(self, 'node', node)
+        _set(self, 'path', path)
+        _set(self, '_str', (node or '') + path)
+        _set(self, '_hash', hash(self._str))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Uri objects are immutable")
+
+    def __reduce__(self):
+        # the slots can't be restored by the default protocol because of the immutability; re-parsing also keeps
+        # copies and unpickled `Uri`s the same objects as the ones already parsed from the same `str`
+        return (_parse_uri, (self._str,))
 
     @property
     def root(self):
         """Returns the topmost `Uri` this `Uri` is part of."""
         return self.parent.root if self.parent else self
 
-    @property
-    def node(self):
-        """Returns the node ID this `Uri` points to."""
-        return self.root._node
-
     def __div__(self, child):
         """Builds a new child `Uri` of this `Uri` with the given `name`."""
         if not child or not isinstance(child, str):
@@ -42,28 +59,20 @@ class Uri(object):
             raise TypeError("Traversing more than 1 level at a time is not supported (yet)")  # pragma: no cover
         return Uri(name=child, parent=self)
 
-    @property
-    def path(self):
-        """Returns the `Uri` without the `node` part as a `str`."""
-        return '/'.join(self.steps)
-
     @property
     def steps(self):
-        """Returns an iterable containing the steps to this `Uri` from the root `Uri`, including the root `Uri`."""
-        def _iter(uri, acc):
-            acc.appendleft(uri.name if uri.name else '')
-            return _iter(uri.parent, acc) if uri.parent else acc
-        return _iter(self, acc=deque())
+        """Returns a tuple containing the steps to this `Uri` from the root `Uri`, including the root `Uri`."""
+        return tuple(self.path.split('/'))
 
     def __str__(self):
-        return (self.node or '') + self.path
+        return self._str
 
     def __repr__(self):
-        return '<@%s>' % (str(self),)
+        return '<@%s>' % (self._str,)
 
     @property
     def url(self):
-        return 'tcp://' + str(self) if self.node else None
+        return 'tcp://' + self._str if self.node else None
 
     @classmethod
     def parse(cls, addr):
@@ -71,15 +80,18 @@ class Uri(object):
 
         >>> u1 = Uri.parse('/foo/bar')
         >>> u1.node, u1.steps, u1.path, u1.name
-        (None, ['', 'foo', 'bar'], '/foo/bar', 'bar')
+        (None, ('', 'foo', 'bar'), '/foo/bar', 'bar')
         >>> u2 = Uri.parse('somenode:123/foo/bar')
-        >>> u2.node, u1.steps, u2.path, ur2.name
-        ('somenode:123', ['', 'foo', 'bar'], '/foo/bar', 'bar')
+        >>> u2.node, u1.steps, u2.path, u2.name
+        ('somenode:123', ('', 'foo', 'bar'), '/foo/bar', 'bar')
         >>> u1 = Uri.parse('foo/bar')
         >>> u1.node, u1.steps, u1.path, u1.name
-        (None, ['foo', 'bar'], 'foo/bar', 'bar')
+        (None, ('foo', 'bar'), 'foo/bar', 'bar')
 
         """
+        ret = cls._parsed.get(addr)
+        if ret is not None:
+            return ret
         if addr.endswith('/'):
             raise ValueError("Uris must not end in '/'")  # pragma: no cover
         parts = addr.split('/')
@@ -92,6 +104,9 @@ class Uri(object):
         for step in parts:
             ret = Uri(name=step, parent=ret, node=node)
             node = None  # only set the node on the root Uri
+        if len(cls._parsed) >= cls._max_parsed:
+            cls._parsed.clear()
+        cls._parsed[addr] = ret
         return ret
 
     @property
@@ -103,7 +118,7 @@ class Uri(object):
             return Uri.parse(self.path)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other):
         """Returns `True` if `other` points to the same actor.
@@ -111,9 +126,18 @@ class Uri(object):
         This method is cooperative with the `pattern_matching` module.
 
         """
+        if self is other:
+            return True
+        if isinstance(other, Uri):
+            return self._hash == other._hash and self._str == other._str
         if isinstance(other, str):
-            other = Uri.parse(other)
-        return str(self) == str(other) or isinstance(other, Matcher) and other == self
+            return self._str == other
+        return isinstance(other, Matcher) and other == self
 
     def __ne__(self, other):
         return not (self == other)
+
+
+def _parse_uri(addr):
+    # `Uri.parse` itself is a bound method, which can't be pickled under Python 2
+    return Uri.parse(addr)
@@ -3,7 +3,7 @@ import time
 
 from spinoff.actor.process import Process
 from spinoff.contrib.filetransfer.filetransfer import FileRef
-from spinoff.util.logging import dbg
+from spinoff.util.logging import dbg, fmt
 from spinoff.util.pattern_matching import IN
 from spinoff.actor._actor import lookup
 
@@ -63,7 +63,7 @@ class Sender(Process):
         t2 = time.time()
 
         dt = t2 - t1
-        dbg("%s bytes transferred in %ss -- speed: %r MB/s" % (bytes, dt, round((bytes / dt) / 1024 / 1024, 2)))
+        dbg(fmt("%s bytes transferred in %ss -- speed: %r MB/s", bytes, dt, round((bytes / dt) / 1024 / 1024, 2)))
 
 
 class Receiver(Process):
@@ -75,7 +75,7 @@ class Receiver(Process):
         md5 = hashlib.md5()
         while True:
             chunk = yield fh.read(CHUNK_SIZE)
-            dbg("READ CHUNK %r AT %r" % (hashlib.md5(chunk[:100]).hexdigest()[:8], str(time.time())[8:]))
+            dbg(fmt("READ CHUNK %r AT %r", hashlib.md5(chunk[:100]).hexdigest()[:8], str(time.time())[8:]))
             md5.update(chunk)
             if len(chunk) < CHUNK_SIZE:
                 break
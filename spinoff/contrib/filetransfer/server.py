@@ -5,7 +5,7 @@ from gevent.threadpool import ThreadPool
 
 from spinoff.actor import Actor
 from spinoff.actor.context import get_context
-from spinoff.util.logging import dbg, err
+from spinoff.util.logging import dbg, fmt, err
 from spinoff.util.pattern_matching import ANY, IN
 from spinoff.contrib.filetransfer.response import Response
 from spinoff.contrib.filetransfer import constants
@@ -47,7 +47,7 @@ class Server(Actor):
             t = datetime.datetime.now()
             for file_id, (file_path, time_added) in self.published.items():
                 if (t - time_added).total_seconds() > constants.FILE_MAX_LIFETIME and file_id not in self.responses.values():
-                    dbg("purging file %r at %r" % (file_id, file_path))
+                    dbg(fmt("purging file %r at %r", file_id, file_path))
                     del self.published[file_id]
         elif ('terminated', IN(self.responses)) == msg:
             _, sender = msg
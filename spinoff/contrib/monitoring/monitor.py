@@ -3,7 +3,7 @@ from twisted.internet import reactor
 from spinoff.actor import Actor
 from spinoff.actor.exceptions import Unhandled
 from spinoff.util.async import after
-from spinoff.util.logging import dbg
+from spinoff.util.logging import dbg, fmt
 from spinoff.util.pattern_matching import ANY, IN
 from .http import run_server
 
@@ -33,7 +33,7 @@ class Monitor(Actor):
         self.num_msgs_received += 1
         dt = t - self.msg_receive_started
         if dt >= 1.0:
-            dbg("%d msg/s" % (float(self.num_msgs_received) / dt))
+            dbg(fmt("%d msg/s", float(self.num_msgs_received) / dt))
             self.msg_receive_started = t
             self.num_msgs_received = 0
         self.num_msgs_received += 1
@@ -2,7 +2,7 @@ import gevent
 
 from spinoff.actor import Actor
 from spinoff.actor.process import Process
-from spinoff.util.logging import dbg
+from spinoff.util.logging import dbg, fmt
 from spinoff.util.async import sleep, with_timeout
 
 
@@ -11,13 +11,13 @@ class ExampleProcess(Process):
         child = self.spawn(ExampleActor)
 
         while True:
-            dbg("sending greeting to %r" % (child,))
+            dbg(fmt("sending greeting to %r", child))
             child << ('hello!', self.ref)
 
-            dbg("waiting for ack from %r" % (child,))
+            dbg(fmt("waiting for ack from %r", child))
             yield with_timeout(5.0, self.get('ack'))
 
-            dbg("got 'ack' from %r; now sleeping a bit..." % (child,))
+            dbg(fmt("got 'ack' from %r; now sleeping a bit...", child))
 
             yield sleep(1.0)
 
@@ -28,7 +28,7 @@ class ExampleActor(Actor):
 
     def receive(self, msg):
         content, sender = msg
-        dbg("%r from %r" % (content, sender))
+        dbg(fmt("%r from %r", content, sender))
         sender << 'ack'
 
     def post_stop(self):
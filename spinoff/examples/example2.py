@@ -1,6 +1,6 @@
 from spinoff.actor import Actor, lookup
 from spinoff.actor.process import Process
-from spinoff.util.logging import dbg
+from spinoff.util.logging import dbg, fmt
 from spinoff.util.async import sleep, with_timeout
 
 
@@ -8,13 +8,13 @@ class ExampleProcess(Process):
     def run(self, other_actor):
         other_actor = lookup(other_actor) if isinstance(other_actor, str) else other_actor
         while True:
-            dbg("sending greeting to %r" % (other_actor,))
+            dbg(fmt("sending greeting to %r", other_actor))
             other_actor << ('hello!', self.ref)
 
-            dbg("waiting for ack from %r" % (other_actor,))
+            dbg(fmt("waiting for ack from %r", other_actor))
             yield with_timeout(5.0, self.get('ack'))
 
-            dbg("got 'ack' from %r; now sleeping a bit..." % (other_actor,))
+            dbg(fmt("got 'ack' from %r; now sleeping a bit...", other_actor))
             yield sleep(1.0)
 
 
@@ -24,7 +24,7 @@ class ExampleActor(Actor):
 
     def receive(self, msg):
         content, sender = msg
-        dbg("%r from %r" % (content, sender))
+        dbg(fmt("%r from %r", content, sender))
         sender << 'ack'
 
     def post_stop(self):
@@ -0,0 +1,241 @@
+# coding: utf8
+from __future__ import print_function, absolute_import
+
+import struct
+from cPickle import dumps
+from cStringIO import StringIO
+
+from spinoff.actor.ref import Ref
+from spinoff.actor.uri import Uri
+from spinoff.remoting.pickler import IncomingMessageUnpickler
+
+
+__all__ = ['UnknownId', 'UNKNOWN_IDS', 'Ids', 'PickleCodec', 'register_codec', 'encode_parts', 'header', 'encode',
+           'decode_header', 'decode_sender', 'decode_message']
+
+
+# the envelope of a remote message is laid out as:
+#   path length (2 bytes) | recipient path | sender length (2 bytes) | sender URI | codec ID (1 byte) | payload
+# with an empty sender URI standing for no sender, and a sender length of `_SENDER_IN_PAYLOAD` for senders that aren't
+# `Ref`s, in which case the payload holds the `(message, sender)` pair instead of just the message.
+#
+# Between two nodes, the path and the sender URI can instead be given by an ID in place of the length: `_REF | id`
+# refers to a string already sent over the same connection, and `_DEFINE | id`, followed by the regular length and
+# string, gives an ID to a string. A node receiving a definition always takes it, so the IDs can be handed out anew
+# any time.
+#
+# An envelope with `_NOTICE` in place of the path length isn't for an actor but for the hub receiving it, and goes out
+# like any other message, so it takes no signal of its own; having no path, it's dropped as malformed by nodes that
+# don't know about it.
+_LEN = struct.Struct('!H')
+_CODEC = struct.Struct('!B')
+_SENDER_IN_PAYLOAD = 0xffff
+_REF, _DEFINE, _MAX_LEN = 0x8000, 0xc000, 0x7fff
+_NOTICE = 0xffff
+MAX_IDS = 0x3fff  # per connection; the last possible ID would collide with `_SENDER_IN_PAYLOAD`
+
+# tells a node that it used IDs not defined (anymore) by the receiver, so that it hands them out anew
+UNKNOWN_IDS = _LEN.pack(_NOTICE) + _CODEC.pack(0)
+
+
+class UnknownId(ValueError):
+    """Raised for envelopes using IDs not defined by the sending node, e.g. if the definition got lost.
+
+    Has the rest of what `decode_header` returns as `path`, `sender_uri`, `codec` and `offset`, with the `path` being
+    `None` and the `sender_uri` `''` if unknown, so that the payload can still be decoded.
+
+    """
+    def __init__(self, path, sender_uri, codec, offset):
+        ValueError.__init__(self, "unknown %s ID" % ('path' if path is None else 'sender',))
+        self.path, self.sender_uri, self.codec, self.offset = path, sender_uri, codec, offset
+
+
+class Ids(object):
+    """The IDs given to the paths and URIs sent over a single connection to a node.
+
+    An ID is only ever referred to over the connection it was defined on, which delivers in order, so the definition
+    always gets there first. Once all of the `max_ids` IDs are in use, the ones of the strings not used lately are
+    given to new strings, as found by a CLOCK sweep; the recipient simply takes the new definitions.
+
+    """
+    __slots__ = ('ids', 'values', 'used', 'hand', 'max_ids')
+
+    def __init__(self, max_ids=MAX_IDS):
+        self.ids = {}  # path or URI => ID
+        self.values = []  # ID => path or URI
+        self.used = []  # ID => used since the sweep last passed it
+        self.hand = 0
+        self.max_ids = max_ids
+
+    def assign(self, value):
+        """Returns the ID of `value`, and whether `value` has only just been given it, i.e. has to be defined."""
+        id = self.ids.get(value)
+        if id is not None:
+            self.used[id] = True
+            return id, False
+        values, used = self.values, self.used
+        if len(values) < self.max_ids:
+            id = len(values)
+            values.append(value)
+            used.append(False)
+        else:
+            id = self.hand
+            while used[id]:
+                used[id] = False
+                id = (id + 1) % self.max_ids
+            self.hand = (id + 1) % self.max_ids
+            del self.ids[values[id]]
+            values[id] = value
+        self.ids[value] = id
+        return id, True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return '<ids:%d/%d>' % (len(self.ids), self.max_ids)
+
+
+class PickleCodec(object):
+    """The default payload codec: pickles the message, with any `Ref`s in it attached to the receiving `Node`."""
+    id = 0
+
+    def encode(self, message):
+        return dumps(message, protocol=2)
+
+    def decode(self, node, data):
+        return IncomingMessageUnpickler(node, StringIO(data)).load()
+
+    def __repr__(self):
+        return 'PickleCodec()'
+
+
+_codecs = {}
+
+
+def register_codec(codec):
+    """Makes `codec` available for decoding incoming messages; the codec has to have an `id` between 0 and 255 and
+    `encode(message)` and `decode(node, data)` methods.
+
+    """
+    if not (isinstance(codec.id, int) and 0 <= codec.id <= 0xff):
+        raise TypeError("codec IDs should be integers between 0 and 255")
+    if _codecs.get(codec.id, codec) is not codec:
+        raise TypeError("codec ID %d is already used by %r" % (codec.id, _codecs[codec.id]))
+    _codecs[codec.id] = codec
+
+
+DEFAULT_CODEC = PickleCodec()
+register_codec(DEFAULT_CODEC)
+
+
+def encode_parts(path, message, sender, codec=DEFAULT_CODEC):
+    """Returns the recipient path, the sender URI and the rest of the envelope of `message` sent to the actor at `path`
+    by `sender`, with the payload encoded by `codec`; `header` gives the start of the envelope for the first two.
+
+    The sender URI is `''` if there is no sender, and `None` if the sender is in the payload.
+
+    """
+    if isinstance(path, unicode):
+        path = path.encode('utf8')
+    if len(path) > _MAX_LEN:
+        raise ValueError("path too long to be sent: %r" % (path,))
+    sender_uri = '' if sender is None else str(sender.uri) if isinstance(sender, Ref) else None
+    if sender_uri is None or len(sender_uri) > _MAX_LEN:
+        return path, None, _CODEC.pack(codec.id) + codec.encode((message, sender))
+    return path, sender_uri, _CODEC.pack(codec.id) + codec.encode(message)
+
+
+def header(path, sender_uri, ids=None):
+    """Returns the start of the envelope for the `path` and the `sender_uri` returned by `encode_parts`.
+
+    If given, `ids` are the `Ids` of the connection the envelope is sent over, and the path and the sender URI are
+    replaced by IDs, with new ones handed out as needed.
+
+    """
+    if ids is None:
+        return ''.join((_LEN.pack(len(path)), path,
+                        _LEN.pack(_SENDER_IN_PAYLOAD) if sender_uri is None else _LEN.pack(len(sender_uri)),
+                        sender_uri or ''))
+    return _compress_field(path, ids) + (
+        _LEN.pack(_SENDER_IN_PAYLOAD) if sender_uri is None else _compress_field(sender_uri, ids))
+
+
+def encode(path, message, sender, codec=DEFAULT_CODEC):
+    """Returns the envelope of `message` to the actor at `path` from `sender`, with the payload encoded by `codec`."""
+    path, sender_uri, rest = encode_parts(path, message, sender, codec)
+    return header(path, sender_uri) + rest
+
+
+def _compress_field(value, ids):
+    if not value:
+        return _LEN.pack(0)
+    id, new = ids.assign(value)
+    if not new:
+        return _LEN.pack(_REF | id)
+    return _LEN.pack(_DEFINE | id) + _LEN.pack(len(value)) + value
+
+
+def decode_header(data, names=None):
+    """Returns the recipient path, the sender URI (`''` if none, `None` if in the payload), the codec and the offset
+    of the payload in the envelope `data`, without touching the payload; raises `ValueError` if `data` is malformed.
+
+    `names` maps the IDs given by the sending node on the connection `data` came over to the strings they stand for;
+    it is updated with any definitions. `UnknownId` is raised for IDs not in `names`.
+
+    """
+    try:
+        path, offset = _decode_field(data, 0, names)
+        sender_uri, offset = _decode_field(data, offset, names)
+        codec_id, = _CODEC.unpack_from(data, offset)
+    except (struct.error, TypeError):
+        raise ValueError("malformed envelope")
+    codec = _codecs.get(codec_id)
+    if codec is None or path is None:
+        raise ValueError("malformed envelope")
+    if path is _UNKNOWN or sender_uri is _UNKNOWN:
+        raise UnknownId(None if path is _UNKNOWN else path, '' if sender_uri is _UNKNOWN else sender_uri,
+                        codec, offset + 1)
+    return path, sender_uri, codec, offset + 1
+
+
+# stands for the strings of IDs not defined by the sending node
+_UNKNOWN = object()
+
+
+def _decode_field(data, offset, names):
+    length, = _LEN.unpack_from(data, offset)
+    offset += 2
+    if length == _SENDER_IN_PAYLOAD:
+        return None, offset
+    elif length & _DEFINE == _DEFINE:
+        id = length & ~_DEFINE
+        value, offset = _decode_field(data, offset, None)
+        names[id] = value
+        return value, offset
+    elif length & _REF:
+        id = length & ~_REF
+        return (names[id] if id in names else _UNKNOWN), offset
+    value = data[offset:offset + length]
+    if len(value) != length:
+        raise ValueError("malformed envelope")
+    return value, offset + length
+
+
+def decode_sender(node, sender_uri):
+    """Returns the `Ref` that `sender_uri` stands for, on the receiving `node`."""
+    if not sender_uri:
+        return None
+    uri = Uri.parse(sender_uri)
+    if uri.node == node.nid:  # our own refs sent back to us
+        return Ref(cell=node.guardian.lookup_cell(uri), uri=uri, node=node, is_local=True)
+    return Ref(cell=None, uri=uri, node=node, is_local=False)
+
+
+def decode_message(node, data, sender_uri, codec, offset):
+    """Returns the `(message, sender)` in the envelope `data` as received by `node`."""
+    payload = codec.decode(node, data[offset:])
+    if sender_uri is None:
+        message, sender = payload
+        return message, sender
+    return payload, decode_sender(node, sender_uri)
@@ -4,18 +4,21 @@ import time
 import socket
 import struct
 import traceback
+from collections import deque
 
 import zmq.green as zmq
 from zope.interface import Interface, implements
 from zope.interface.verify import verifyClass
 from gevent import sleep, spawn, spawn_later
+from gevent.event import Event, AsyncResult
+from gevent.hub import getcurrent
 from gevent.socket import gethostbyname
-from gevent.lock import RLock
 
+from spinoff.remoting import envelope
 from spinoff.remoting.hublogic import (
     HubLogic, Connect, Disconnect, SigDisconnect, Send, Ping,
     RelaySigNew, RelayConnect, RelaySigConnected, RelaySend, RelayForward, RelaySigNodeDown, RelayNvm,
-    Receive, SendFailed, NodeDown, NextBeat, Bind, IN, OUT, flatten)
+    Receive, SendFailed, NodeDown, NextBeat, Bind, IN, OUT, flatten, nid2addr)
 from spinoff.util.logging import err
 
 
@@ -42,31 +45,140 @@ class IHub(Interface):
     def unwatch_node(nid, watch_handle):
         pass
 
+    def unknown_ids_from(nid):
+        """Reports a message from `nid` using IDs not defined by it, so that `nid` defines its IDs anew."""
+
     def stop():
         pass
 
 
+EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION = -3  # no EAI_... in socket for this errno
+
+# returned by `Resolver.get` for host names not (or no longer) in the cache
+_UNRESOLVED = object()
+
+
+class Resolver(object):
+    """Caches the IP addresses that host names resolve to for `ttl` seconds, and the failures to resolve them for
+    `negative_ttl` seconds.
+
+    `get` only ever looks at the cache, so that the code doing the network operations never waits on DNS; `resolve`
+    does the actual resolving, with any concurrent resolving of the same host name waiting for the same result.
+
+    """
+    ttl = 300.0
+    negative_ttl = 5.0
+
+    def __init__(self, ttl=None, negative_ttl=None, gethostbyname=gethostbyname):
+        if ttl is not None:
+            self.ttl = ttl
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        self._gethostbyname = gethostbyname
+        self._cache = {}  # host => (ip or None, expiry time)
+        self._pending = {}  # host => AsyncResult
+
+    def get(self, host):
+        """Returns the cached IP address of `host`, `None` if it's known not to resolve, or `_UNRESOLVED`."""
+        entry = self._cache.get(host)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+        if _is_ip(host):
+            return host
+        return _UNRESOLVED
+
+    def resolve(self, host):
+        """Returns the IP address of `host`, or `None` if it doesn't resolve, looking it up unless cached."""
+        ip = self.get(host)
+        if ip is not _UNRESOLVED:
+            return ip
+        pending = self._pending.get(host)
+        if pending is not None:
+            return pending.get()
+        self._pending[host] = pending = AsyncResult()
+        ip = None
+        try:
+            ip = self._gethostbyname(host)
+        except socket.gaierror as e:
+            # XXX: perhaps we should retry in a few sec in case of EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION?
+            if e.errno not in (socket.EAI_NONAME, EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION):
+                err("%s\n%s" % (e, traceback.format_exc()))
+        finally:
+            self._cache[host] = (ip, time.time() + (self.ttl if ip else self.negative_ttl))
+            del self._pending[host]
+            pending.set(ip)
+        return ip
+
+    def __repr__(self):
+        return "<resolver:%d cached, %d pending>" % (len(self._cache), len(self._pending))
+
+
+def _is_ip(host):
+    try:
+        socket.inet_aton(host)
+    except (socket.error, TypeError):
+        return False
+    return host.count('.') == 3
+
+
 _DELETED = object()
 
+# tells the writer that the host name of a node address it has been waiting for has been resolved
+_Resolved = object()
+
+
+class _UnknownIdsNotice(object):
+    # sent like a message, as its version header keeps the recipient from taking it for a restart
+    def serialize(self, ids=None):
+        return envelope.UNKNOWN_IDS
+
+    def send_failed(self):  # pragma: no cover
+        pass
+
+    def __repr__(self):
+        return '_UnknownIdsNotice()'
+_UNKNOWN_IDS_NOTICE = _UnknownIdsNotice()
+
 
 class Hub(object):
     """Handles traffic between actors on different nodes.
 
     The wire-transport implementation is specified/overridden by the `incoming` and `outgoing` parameters.
 
+    All network operations are done by a single writer greenlet, in the order the hub logic emits them, so sending a
+    remote message only runs the logic and queues up the result, without ever waiting on the network, heartbeats or
+    incoming traffic.
+
+    Outgoing messages are furthermore collected per recipient node by the writer for `batch_window` seconds (by default
+    only until it runs out of things to do), or until `batch_max_bytes` of them have been collected, and then sent out
+    as a single multipart frame with one version header: `(nid, header, msg1, msg2, ...)`. A lone message is sent as a
+    regular `(nid, header + msg)` frame. Anything else sent to a node flushes the messages collected for it first so
+    that the order, and thus the versions seen by the recipient, are kept.
+
+    The recipient paths and sender URIs of the messages are given IDs per connection to the recipient node, i.e. per
+    socket used to send to it, as they are first sent over it, with later messages only carrying the IDs (see
+    `envelope.header` and `envelope.Ids`). As the messages sent to a node over different sockets, or through a relay,
+    can overtake each other, the IDs are never used across connections, and relayed messages don't use IDs at all. The
+    IDs are handed out anew whenever the node is reported down, as it might have restarted, or reports IDs it doesn't
+    know, as it might have restarted unnoticed or missed a definition; the names received from a node are likewise
+    dropped once it is reported down. `on_receive` is called with the sender, the message and the names defined by
+    the sender on the connection the message came over (`None` if relayed).
+
     """
     implements(IHub)
 
     FAKE_INACCESSIBLE_NADDRS = set()
 
+    # shared by all hubs in the process by default
+    resolver = Resolver()
+
     def __init__(self, nid, is_relay=False, on_node_down=lambda ref, nid: ref << ('_node_down', nid),
-                 on_receive=lambda sender_nid, msg_h: print("deliver", msg_h, "from", sender_nid),
-                 heartbeat_interval=1.0, heartbeat_max_silence=3.0):
+                 on_receive=lambda sender_nid, msg_h, names: print("deliver", msg_h, "from", sender_nid),
+                 heartbeat_interval=1.0, heartbeat_max_silence=3.0, batch_window=0.0, batch_max_bytes=64 * 1024):
         self.nid = nid
         self.is_relay = is_relay
         self._on_node_down = on_node_down
         self._on_receive = on_receive
-        self._lock = RLock()
         self._logic = HubLogic(nid, is_relay=is_relay,
                                heartbeat_interval=heartbeat_interval,
                                heartbeat_max_silence=heartbeat_max_silence)
@@ -81,6 +193,18 @@ class Hub(object):
         self._listener_out.link_exception(lambda _: self.stop())
         self._heartbeater = None
         self._watched_nodes = {}
+        self.batch_window = batch_window
+        self.batch_max_bytes = batch_max_bytes
+        self._outbox = {}  # nid => [use_sock, version, [msg_bytes], num_bytes]
+        self._endpoints = {}  # naddr => the zmq endpoint connected to
+        self._resolving = {}  # naddr => the actions put aside until the host name is resolved
+        self._ids = {}  # nid => {socket => envelope.Ids}, for the messages sent to it
+        self._names = {}  # nid => {socket => {ID => path or URI}}, for the messages received from it
+        # the network operations to be done by the writer, in order; `None` tells it to stop
+        self._outq = deque()
+        self._wakeup = Event()
+        self._writer = spawn(self._write)
+        self._writer.link_exception(lambda _: self.stop())
         self._initialized = True
         self._start()
 
@@ -120,6 +244,11 @@ class Hub(object):
         if hasattr(self, '_initialized'):
             logic, self._logic = self._logic, None
             self._execute(logic.shutdown)
+            # let the writer send out everything before the sockets are closed
+            self._outq.append(None)
+            self._wakeup.set()
+            if self._writer is not getcurrent():
+                self._writer.join()
             sleep(.1)  # XXX: needed?
         if hasattr(self, '_ctx'):
             self._insock = self._outsock = None
@@ -135,12 +264,18 @@ class Hub(object):
     def _listen(self, sock, on_sock):
         recv, t, execute, message_received, ping_received, sig_disconnect_received = (
             sock.recv_multipart, time.time, self._execute, self._logic.message_received, self._logic.ping_received, self._logic.sig_disconnect_received)
+        batch_received = self._logic.batch_received
         while True:
             data = recv()
             try:
                 sender_nid, msg_bytes = data
             except ValueError:
-                continue  # malformed input
+                if len(data) > 2 and len(data[1]) == 4:
+                    sender_nid, msg_bytes, batch = data[0], data[1], data[2:]
+                    if msg_bytes >= MIN_VERSION_BITS:
+                        version = struct.unpack(MSG_HEADER_FORMAT, msg_bytes)[0] - MIN_VERSION_VALUE
+                        execute(batch_received, on_sock, sender_nid, version, batch, t())
+                continue  # malformed input otherwise
             # dbg("recv", repr(msg_bytes), "from", sender_nid)
             msg_header, msg_bytes = msg_bytes[:4], msg_bytes[4:]
             if msg_header == SIG_DISCONNECT:
@@ -177,105 +312,228 @@ class Hub(object):
                     execute(ping_received, on_sock, sender_nid, version, t())
 
     def _execute(self, fn, *args, **kwargs):
+        # runs a step of the logic and does whatever doesn't involve the network right away; the rest is handed over
+        # to the writer in the order it was emitted in
         g = fn(*args, **kwargs)
         if g is None:
             return
-        insock_send, outsock_send, on_receive = self._insock.send_multipart, self._outsock.send_multipart, self._on_receive
-        with self._lock:
-            for action in flatten(g):
-                cmd = action[0]
-                # if cmd not in (NextBeat,):
-                #     dbg("%s -> %s: %s" % (fn.__name__.ljust(25), cmd, ", ".join(repr(x) for x in action[1:])))
-                if cmd is Send:
-                    _, use_sock, nid, version, msg_h = action
-                    (outsock_send if use_sock == OUT else insock_send)((nid, struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version) + msg_h.serialize()))
-                elif cmd is Receive:
-                    _, sender_nid, msg_bytes = action
-                    on_receive(sender_nid, msg_bytes)
-                elif cmd is RelaySend:
-                    _, use_sock, relay_nid, relayee_nid, msg_h = action
-                    (outsock_send if use_sock == OUT else insock_send)((relay_nid, SIG_RELAY_SEND + relayee_nid + '\0' + msg_h.serialize()))
-                elif cmd is RelayForward:
-                    _, use_sock, recipient_nid, relayer_nid, relayed_bytes = action
-                    (outsock_send if use_sock == OUT else insock_send)((recipient_nid, SIG_RELAY_FORWARDED + relayer_nid + '\0' + relayed_bytes))
-                elif cmd is Ping:
-                    _, use_sock, nid, version = action
-                    (outsock_send if use_sock == OUT else insock_send)((nid, struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version)))
-                elif cmd is NextBeat:
-                    _, time_to_next = action
-                    if self._heartbeater is not _DELETED:
-                        self._heartbeater = spawn_later(time_to_next, self._heartbeat)
-                elif cmd is RelaySigNew:
-                    _, use_sock, nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((nid, SIG_NEW_RELAY))
-                elif cmd is RelayConnect:
-                    _, use_sock, relay_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relay_nid, SIG_RELAY_CONNECT + relayee_nid))
-                elif cmd is RelaySigConnected:
-                    _, use_sock, relayer_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relayer_nid, SIG_RELAY_CONNECTED + relayee_nid))
-                elif cmd is RelaySigNodeDown:
-                    _, use_sock, relayer_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relayer_nid, SIG_RELAY_NODEDOWN + relayee_nid))
-                elif cmd is RelayNvm:
-                    _, use_sock, relay_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relay_nid, SIG_RELAY_NVM + relayee_nid))
-                elif cmd is SendFailed:
-                    _, msg_h = action
-                    msg_h.send_failed()
-                elif cmd is SigDisconnect:
-                    _, use_sock, nid = action
-                    (outsock_send if use_sock == OUT else insock_send)([nid, SIG_DISCONNECT])
-                elif cmd is NodeDown:
-                    _, nid = action
-                    for watch_handle in self._watched_nodes.pop(nid, []):
-                        self._on_node_down(watch_handle, nid)
-                elif cmd is Connect:
-                    _, naddr = action
-                    if naddr not in self.FAKE_INACCESSIBLE_NADDRS:
-                        zmqaddr = naddr_to_zmq_endpoint(naddr)
-                        if zmqaddr:
-                            self._outsock.connect(zmqaddr)
-                        else:
-                            pass  # TODO: would be nicer if we used this information and notified an immediate disconnect
-                    sleep(0.001)
-                elif cmd is Disconnect:
-                    _, naddr = action
-                    if naddr not in self.FAKE_INACCESSIBLE_NADDRS:
-                        zmqaddr = naddr_to_zmq_endpoint(naddr)
-                        if zmqaddr:
-                            try:
-                                self._outsock.disconnect(zmqaddr)
-                            except zmq.ZMQError:
-                                pass
-                elif cmd is Bind:
-                    _, naddr = action
-                    zmqaddr = naddr_to_zmq_endpoint(naddr)
-                    if not zmqaddr:
-                        raise Exception("Failed to bind to %s" % (naddr,))
-                    self._insock.bind(zmqaddr)
+        outq = self._outq
+        queued = False
+        for action in flatten(g):
+            cmd = action[0]
+            # if cmd not in (NextBeat,):
+            #     dbg("%s -> %s: %s" % (fn.__name__.ljust(25), cmd, ", ".join(repr(x) for x in action[1:])))
+            if cmd is Receive:
+                _, on_sock, sender_nid, msg_bytes = action
+                if msg_bytes == envelope.UNKNOWN_IDS:
+                    # the messages after this one define the IDs again before using them
+                    self._ids.pop(sender_nid, None)
                 else:
-                    assert False, "unknown command: %r" % (cmd,)
+                    names = None if on_sock is None else self._names_from(sender_nid, on_sock)
+                    self._on_receive(sender_nid, msg_bytes, names)
+            elif cmd is SendFailed:
+                _, msg_h = action
+                msg_h.send_failed()
+            elif cmd is NodeDown:
+                _, nid = action
+                # the node might have restarted and forgotten the IDs; they get handed out again from scratch, and the
+                # node does the same with ours
+                self._ids.pop(nid, None)
+                self._names.pop(nid, None)
+                for watch_handle in self._watched_nodes.pop(nid, []):
+                    self._on_node_down(watch_handle, nid)
+            elif cmd is NextBeat:
+                _, time_to_next = action
+                if self._heartbeater is not _DELETED:
+                    self._heartbeater = spawn_later(time_to_next, self._heartbeat)
+            elif cmd is Bind:
+                _, naddr = action
+                zmqaddr = naddr_to_zmq_endpoint(naddr, resolve=self.resolver.resolve)
+                if not zmqaddr:
+                    raise Exception("Failed to bind to %s" % (naddr,))
+                self._insock.bind(zmqaddr)
+            else:
+                outq.append(action)
+                queued = True
+        if queued and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _write(self):
+        outq, wakeup, perform = self._outq, self._wakeup, self._perform
+        deadline = None
+        while True:
+            wakeup.wait(None if deadline is None else max(deadline - time.time(), 0))
+            wakeup.clear()
+            while outq:
+                action = outq.popleft()
+                if action is None:  # stopping
+                    self._flush_outbox()
+                    return
+                perform(action)
+            if self._outbox:
+                t = time.time()
+                if deadline is None:
+                    deadline = t + self.batch_window
+                if t >= deadline:
+                    self._flush_outbox()
+                    deadline = None
+            else:
+                deadline = None
+
+    def _perform(self, action):
+        send = self._send
+        cmd = action[0]
+        if self._resolving and cmd is not _Resolved:
+            deferred = self._resolving.get(action[1] if cmd is Connect or cmd is Disconnect else nid2addr(action[2]))
+            if deferred is not None:
+                deferred.append(action)
+                return
+        if cmd is Send:
+            _, use_sock, nid, version, msg_h = action
+            self._enqueue(use_sock, nid, version, msg_h.serialize(self._ids_for(nid, use_sock)))
+        elif cmd is RelaySend:
+            _, use_sock, relay_nid, relayee_nid, msg_h = action
+            send(use_sock, relay_nid, SIG_RELAY_SEND + relayee_nid + '\0' + msg_h.serialize())
+        elif cmd is RelayForward:
+            _, use_sock, recipient_nid, relayer_nid, relayed_bytes = action
+            send(use_sock, recipient_nid, SIG_RELAY_FORWARDED + relayer_nid + '\0' + relayed_bytes)
+        elif cmd is Ping:
+            _, use_sock, nid, version = action
+            send(use_sock, nid, struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version))
+        elif cmd is RelaySigNew:
+            _, use_sock, nid = action
+            send(use_sock, nid, SIG_NEW_RELAY)
+        elif cmd is RelayConnect:
+            _, use_sock, relay_nid, relayee_nid = action
+            send(use_sock, relay_nid, SIG_RELAY_CONNECT + relayee_nid)
+        elif cmd is RelaySigConnected:
+            _, use_sock, relayer_nid, relayee_nid = action
+            send(use_sock, relayer_nid, SIG_RELAY_CONNECTED + relayee_nid)
+        elif cmd is RelaySigNodeDown:
+            _, use_sock, relayer_nid, relayee_nid = action
+            send(use_sock, relayer_nid, SIG_RELAY_NODEDOWN + relayee_nid)
+        elif cmd is RelayNvm:
+            _, use_sock, relay_nid, relayee_nid = action
+            send(use_sock, relay_nid, SIG_RELAY_NVM + relayee_nid)
+        elif cmd is SigDisconnect:
+            _, use_sock, nid = action
+            send(use_sock, nid, SIG_DISCONNECT)
+        elif cmd is Connect:
+            _, naddr = action
+            if naddr not in self.FAKE_INACCESSIBLE_NADDRS:
+                zmqaddr = naddr_to_zmq_endpoint(naddr, resolve=self.resolver.get)
+                if zmqaddr is _UNRESOLVED:
+                    # instead of holding up the writer, try again once resolved, and put aside everything for the
+                    # node until then
+                    self._resolving[naddr] = []
+                    spawn(self._resolve, naddr)
+                    return
+                elif not self._connect(naddr, zmqaddr):
+                    return
+            sleep(0.001)  # gives the connection a head start; only holds up the writer
+        elif cmd is Disconnect:
+            _, naddr = action
+            zmqaddr = self._endpoints.pop(naddr, None)
+            if zmqaddr:
+                try:
+                    self._outsock.disconnect(zmqaddr)
+                except zmq.ZMQError:
+                    pass
+        elif cmd is _Resolved:
+            _, naddr, ip = action
+            deferred = self._resolving.pop(naddr)
+            if self._connect(naddr, naddr_to_zmq_endpoint(naddr, resolve=lambda _: ip)):
+                sleep(0.001)
+            for action in deferred:
+                self._perform(action)
+        else:
+            assert False, "unknown command: %r" % (cmd,)
+
+    def _names_from(self, nid, on_sock):
+        # what the IDs in the messages received from `nid` on `on_sock` stand for, as defined by the messages so far
+        by_sock = self._names.setdefault(nid, {})
+        names = by_sock.get(on_sock)
+        if names is None:
+            names = by_sock[on_sock] = {}
+        return names
+
+    def unknown_ids_from(self, nid):
+        if self._logic:
+            self._execute(self._logic.unknown_ids_received, nid, _UNKNOWN_IDS_NOTICE)
+
+    def _ids_for(self, nid, use_sock):
+        by_sock = self._ids.setdefault(nid, {})
+        ids = by_sock.get(use_sock)
+        if ids is None:
+            ids = by_sock[use_sock] = envelope.Ids()
+        return ids
+
+    def _connect(self, naddr, zmqaddr):
+        if zmqaddr:
+            self._outsock.connect(zmqaddr)
+            self._endpoints[naddr] = zmqaddr
+            return True
+        if self._logic is not None:  # otherwise stopping, with everything queued up for the node already failed
+            self._execute(self._logic.connect_failed, naddr)
+        return False
+
+    def _resolve(self, naddr):
+        # whatever happens, the writer has to get to connect, or fail whatever it has put aside for the node
+        ip = None
+        try:
+            ip = self.resolver.resolve(naddr.rsplit(':', 1)[0])
+        except Exception:
+            err("Failed to resolve %s\n%s" % (naddr, traceback.format_exc()))
+        finally:
+            self._outq.append((_Resolved, naddr, ip))
+            self._wakeup.set()
+
+    def _send(self, use_sock, nid, frame):
+        if nid in self._outbox:
+            self._flush(nid)
+        (self._outsock if use_sock == OUT else self._insock).send_multipart((nid, frame))
+
+    def _enqueue(self, use_sock, nid, version, msg_bytes):
+        batch = self._outbox.get(nid)
+        if batch is not None and batch[0] != use_sock:
+            self._flush(nid)
+            batch = None
+        if batch is None:
+            batch = self._outbox[nid] = [use_sock, version, [], 0]
+        batch[1] = version  # the versions only ever grow, so the last one is what the recipient has to see
+        batch[2].append(msg_bytes)
+        batch[3] += len(msg_bytes)
+        if batch[3] >= self.batch_max_bytes:
+            self._flush(nid)
+
+    def _flush(self, nid):
+        use_sock, version, msgs, _ = self._outbox.pop(nid)
+        header = struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version)
+        (self._outsock if use_sock == OUT else self._insock).send_multipart(
+            (nid, header + msgs[0]) if len(msgs) == 1 else (nid, header) + tuple(msgs))
+
+    def _flush_outbox(self):
+        for nid in self._outbox.keys():
+            self._flush(nid)
 
     def _heartbeat(self):
         self._execute(self._logic.heartbeat, time.time())
 verifyClass(IHub, Hub)
 
 
-EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION = -3  # no EAI_... in socket for this errno
+def naddr_to_zmq_endpoint(nid, resolve=None):
+    """Returns the zmq endpoint of a node address, or `None` if it is malformed or doesn't resolve.
 
+    Host names are resolved by `Hub.resolver` unless another `resolve` function is given.
 
-def naddr_to_zmq_endpoint(nid):
+    """
     if '\0' in nid:
         return None
     try:
         host, port = nid.split(':')
     except ValueError:
         return None
-    try:
-        return 'tcp://%s:%s' % (gethostbyname(host), port)
-    except socket.gaierror as e:
-        # XXX: perhaps we should retry in a few sec in case of EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION?
-        if e.errno not in (socket.EAI_NONAME, EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION):
-            err("%s\n%s" % (e, traceback.format_exc()))
-    return None
+    ip = (resolve or Hub.resolver.resolve)(host)
+    if ip is None or ip is _UNRESOLVED:
+        return ip
+    return 'tcp://%s:%s' % (ip, port)
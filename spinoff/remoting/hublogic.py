@@ -155,7 +155,13 @@ class HubLogic(object):
     def message_received(self, on_sock, sender_nid, version, msg_body_bytes, t):
         yield self.ping_received(on_sock, sender_nid, version, t)
         if msg_body_bytes:
-            yield Receive, sender_nid, msg_body_bytes
+            yield Receive, on_sock, sender_nid, msg_body_bytes
+
+    def batch_received(self, on_sock, sender_nid, version, msgs_body_bytes, t):
+        yield self.ping_received(on_sock, sender_nid, version, t)
+        for msg_body_bytes in msgs_body_bytes:
+            if msg_body_bytes:
+                yield Receive, on_sock, sender_nid, msg_body_bytes
 
     def heartbeat(self, t):
         t_gone = t - self.heartbeat_max_silence
@@ -215,7 +221,16 @@ class HubLogic(object):
         yield RelayForward, IN, relayee_nid, relayer_nid, relayed_bytes
 
     def relay_forwarded_received(self, actual_sender_nid, relayed_bytes):
-        yield Receive, actual_sender_nid, relayed_bytes
+        # not received directly from the sender, so there's no connection to speak of
+        yield Receive, None, actual_sender_nid, relayed_bytes
+
+    def unknown_ids_received(self, sender_nid, notice_h):
+        # the messages from the node refer to IDs not defined (anymore) here, so it has to hand them out anew; nodes
+        # only heard from through a relay can't be told, and define their IDs anew once they see this node go down
+        if sender_nid in self.channels_in:
+            yield Send, IN, sender_nid, self._next_version(), notice_h
+        elif sender_nid in self.channels_out:
+            yield Send, OUT, sender_nid, self._next_version(), notice_h
 
     def relay_nvm_received(self, sender_nid, relayee_nid):
         self.rl_relayees.get(relayee_nid, set()).discard(sender_nid)
@@ -233,6 +248,14 @@ class HubLogic(object):
             if self.is_relay:
                 yield RelaySigNew, OUT, nid
 
+    def connect_failed(self, naddr):
+        # the address of the node couldn't even be resolved, so there's no point in waiting for it to show up
+        for nid in list(self.channels_out):
+            if nid2addr(nid) == naddr and nid not in self.channels_in:
+                self.channels_out.remove(nid)
+                yield RELAY_NODEDOWN_CHECKS(self, nid)
+                yield NODEDOWN(self, nid)
+
     def shutdown(self):
         for nid in (self.channels_in | self.channels_out):
             yield SigDisconnect, (IN if nid in self.channels_in else OUT), nid
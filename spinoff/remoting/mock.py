@@ -8,7 +8,7 @@ from zope.interface import implements
 from zope.interface.verify import verifyClass
 
 from spinoff.actor import Node
-from spinoff.util.logging import logstring, dbg
+from spinoff.util.logging import logstring, dbg, fmt
 from spinoff.remoting.hub import IHub
 from spinoff.remoting.validation import _assert_valid_nodeid, _assert_valid_addr
 
@@ -69,7 +69,7 @@ class MockNetwork(object):  # pragma: no cover
             assert endpoint.type == 'connect', "Hubs should only connect MockOutSockets and not bind"
             _assert_valid_addr(endpoint.address)
             assert (addr, endpoint.address) not in self.connections
-            dbg(u"%s → %s" % (addr, endpoint.address))
+            dbg(fmt(u"%s → %s", addr, endpoint.address))
             self.connections.add((addr, endpoint.address))
 
     def disconnect(self, src, dst):
@@ -106,7 +106,7 @@ class MockNetwork(object):  # pragma: no cover
             # assert (src, dst) in self.connections, "Hubs should only send messages to addresses they have previously connected to"
 
             if random.random() <= self._packet_loss.get((src, dst), 0.0):
-                dbg("packet lost: %r  %s → %s" % (msg, src, dst))
+                dbg(fmt("packet lost: %r  %s → %s", msg, src, dst))
                 continue
 
             if dst not in self.listeners:
@@ -31,4 +31,7 @@ class HubWithNoRemoting(object):
 
     def unwatch_node(self, *args, **kwargs):
         raise RuntimeError("Attempt to unwatch a remote node but remoting is not available")
+
+    def unknown_ids_from(self, nid):  # pragma: no cover
+        pass
 verifyClass(IHub, HubWithNoRemoting)
@@ -29,7 +29,6 @@ class IncomingMessageUnpickler(Unpickler):
                 ref.is_local = True
                 ref._cell = self.node.guardian.lookup_cell(ref.uri)
                 # dbg(("dead " if not ref._cell else "") + "local ref detected")
-                del ref.node  # local refs never need access to the node
         else:  # pragma: no cover
             self.load_build()
 
@@ -1,19 +1,30 @@
 from __future__ import print_function
 
+import copy
 import gc
+import pickle
 import random
 import re
+import socket
+import time
 import weakref
 
-from gevent import idle, sleep, GreenletExit, with_timeout, Timeout
+from gevent import idle, sleep, spawn, getcurrent, GreenletExit, with_timeout, Timeout
 from gevent.event import Event, AsyncResult
 from gevent.queue import Channel
 from nose.tools import eq_, ok_
 
 from spinoff.actor import Actor, Props, Node, Uri
+from spinoff.actor.context import get_context
+from spinoff.actor.dispatcher import Dispatcher, dispatcher
+from spinoff.actor.handlers import on, dispatch
 from spinoff.actor.ref import Ref
 from spinoff.actor.events import Events, UnhandledMessage, DeadLetter
 from spinoff.actor.exceptions import Unhandled, NameConflict, UnhandledTermination
+from spinoff.actor.mailbox import BLOCK, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER, overflows as mailbox_overflows
+from spinoff.actor.node import _Msg
+from spinoff.remoting.hub import Resolver
+from spinoff.remoting.hublogic import Receive, IN, OUT
 from spinoff.util.pattern_matching import ANY, IS_INSTANCE
 from spinoff.util.testing import assert_raises, expect_one_warning, expect_one_event, expect_failure, MockActor, expect_event_not_emitted
 from spinoff.util.testing.actor import wrap_globals
@@ -199,6 +210,360 @@ def test_with_no_receive_method_all_messages_are_unhandled(defer):
         a << 'dummy'
 
 
+@deferred_cleanup
+def test_receive_runs_inline_without_a_greenlet_per_message(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            greenlets.append(getcurrent())
+
+    node = DummyNode()
+    defer(node.stop)
+    greenlets = obs_list()
+    node.spawn(MyActor) << 1 << 2 << 3
+    greenlets.wait_eq([ANY, ANY, ANY])
+    eq_(len(set(greenlets)), 1)
+
+
+@deferred_cleanup
+def test_non_inline_receive_runs_each_message_in_a_separate_greenlet(defer):
+    class MyActor(Actor):
+        inline = False
+
+        def receive(self, message):
+            greenlets.append(getcurrent())
+            released.wait()
+
+    node = DummyNode()
+    defer(node.stop)
+    greenlets, released = obs_list(), Event()
+    a = node.spawn(MyActor) << 1 << 2
+    greenlets.wait_eq([ANY])
+    released.set()
+    greenlets.wait_eq([ANY, ANY])
+    eq_(len(set(greenlets)), 2)
+    with expect_one_event(DeadLetter(a, 'dummy', sender=None)):
+        a.stop()
+        a << 'dummy'
+
+
+@deferred_cleanup
+def test_letters_are_not_compared_against_system_messages(defer):
+    class Untouchable(object):
+        def __eq__(self, other):
+            compared.set()
+            return False
+
+    class MyActor(Actor):
+        def receive(self, message):
+            received.set(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    compared, received, message = Event(), AsyncResult(), Untouchable()
+    node.spawn(MyActor) << message
+    ok_(received.get() is message)
+    ok_(not compared.is_set())
+
+
+@deferred_cleanup
+def test_actors_yield_to_each_other_after_processing_throughput_messages(defer):
+    class MyActor(Actor):
+        def __init__(self, name):
+            self.name = name
+
+        def receive(self, message):
+            received.append(self.name)
+
+    node = DummyNode()
+    defer(node.stop)
+    received = obs_list()
+    node.spawn(MyActor.using('a', _throughput=2)) << 1 << 2 << 3 << 4
+    node.spawn(MyActor.using('b', _throughput=2)) << 1 << 2 << 3 << 4
+    received.wait_eq(['a', 'a', 'b', 'b', 'a', 'a', 'b', 'b'])
+
+    class HotActor(MyActor):
+        throughput = 4
+
+    received = obs_list()
+    node.spawn(HotActor.using('a')) << 1 << 2 << 3 << 4
+    node.spawn(HotActor.using('b')) << 1 << 2 << 3 << 4
+    received.wait_eq(['a', 'a', 'a', 'a', 'b', 'b', 'b', 'b'])
+
+
+@deferred_cleanup
+def test_dispatching_messages_to_handlers_by_pattern(defer):
+    class MyActor(Actor):
+        @on(('ping', ANY))
+        def ping(self, message):
+            received.append(('ping', message))
+
+        @on('stop', ('stop', ANY))
+        def stop(self, message):
+            received.append(('stop', message))
+
+        receive = dispatch()
+
+    class MySubActor(MyActor):
+        def stop(self, message):
+            raise AssertionError("should not be used as a handler")
+
+    node = DummyNode()
+    defer(node.stop)
+    received = obs_list()
+    a = node.spawn(MyActor)
+    a << ('ping', 1) << 'stop' << ('stop', 2)
+    received.wait_eq([('ping', ('ping', 1)), ('stop', 'stop'), ('stop', ('stop', 2))])
+    with expect_one_event(UnhandledMessage(a, 'pong', sender=None)):
+        a << 'pong'
+
+    received = obs_list()
+    b = node.spawn(MySubActor)
+    b << ('ping', 1)
+    received.wait_eq([('ping', ('ping', 1))])
+    with expect_one_event(UnhandledMessage(b, 'stop', sender=None)):
+        b << 'stop'
+
+
+@deferred_cleanup
+def test_idle_actors_do_not_hold_on_to_greenlets(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    received = obs_list()
+    for i in range(100):
+        node.spawn(MyActor) << i
+    received.wait_eq(range(100))
+    idle()
+    ok_(dispatcher.workers <= Dispatcher.max_idle)
+
+
+@deferred_cleanup
+def test_an_actor_blocked_in_receive_does_not_hold_up_other_actors(defer):
+    class BlockingActor(Actor):
+        def receive(self, message):
+            released.wait()
+            received.append(message)
+
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    received, released = obs_list(), Event()
+    node.spawn(BlockingActor) << 'blocked'
+    node.spawn(MyActor) << 'not-blocked'
+    received.wait_eq(['not-blocked'])
+    released.set()
+    received.wait_eq(['not-blocked', 'blocked'])
+
+
+@deferred_cleanup
+def test_busy_actors_do_not_starve_timers(defer):
+    class PingPong(Actor):
+        def receive(self, message):
+            other, n = message
+            if n < NUM_MESSAGES:
+                other << (self.ref, n + 1)
+            else:
+                done.set(len(ticks))
+
+    NUM_MESSAGES = 5000
+    node = DummyNode()
+    defer(node.stop)
+    ticks, done = [], AsyncResult()
+
+    def ticker():
+        while True:
+            sleep(0.001)
+            ticks.append(True)
+    ticker = spawn(ticker)
+    defer(ticker.kill)
+    a, b = node.spawn(PingPong), node.spawn(PingPong)
+    t0 = time.time()
+    a << (b, 0)
+    ticks_while_busy = done.get()
+    ok_(ticks_while_busy >= (time.time() - t0) / 0.001 / 10, "timer only ran %d times" % (ticks_while_busy,))
+
+
+##
+## MAILBOXES
+
+@deferred_cleanup
+def test_bounded_mailbox_overflow_policies(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+
+    received = obs_list()
+    node.spawn(MyActor.using(_mailbox_capacity=2, _mailbox_overflow=DROP_NEWEST)) << 1 << 2 << 3 << 4
+    received.wait_eq([1, 2])
+
+    received = obs_list()
+    node.spawn(MyActor.using(_mailbox_capacity=2, _mailbox_overflow=DROP_OLDEST)) << 1 << 2 << 3 << 4
+    received.wait_eq([3, 4])
+
+    received = obs_list()
+    a = node.spawn(MyActor.using(_mailbox_capacity=2, _mailbox_overflow=DEAD_LETTER))
+    with expect_one_event(DeadLetter(a, 3, sender=None)):
+        a << 1 << 2 << 3
+    received.wait_eq([1, 2])
+
+    with assert_raises(TypeError):
+        MyActor.using(_mailbox_capacity=0)
+    with assert_raises(TypeError):
+        MyActor.using(_mailbox_overflow='drop')
+
+
+@deferred_cleanup
+def test_termination_notices_are_not_limited_by_the_mailbox_capacity(defer):
+    class Watcher(Actor):
+        def pre_start(self):
+            self.watch(watchee)
+
+        def receive(self, message):
+            released.wait()
+            received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    for overflow in [BLOCK, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER]:
+        released, received = Event(), obs_list()
+        watchee = node.spawn(Actor)
+        watcher = node.spawn(Watcher.using(_mailbox_capacity=1, _mailbox_overflow=overflow)) << 'busy'
+        sleep(0)
+        watcher << 'pending'
+        watchee.stop()
+        sleep(0)
+        if overflow is DROP_OLDEST:
+            watcher << 'late'  # drops 'pending', not the notice
+        released.set()
+        if overflow is DROP_OLDEST:
+            received.wait_eq(['busy', ('terminated', watchee), 'late'])
+        else:
+            received.wait_eq(['busy', 'pending', ('terminated', watchee)])
+
+
+@deferred_cleanup
+def test_bounded_mailbox_blocks_the_sender_until_there_is_room(defer):
+    class MyActor(Actor):
+        mailbox_capacity = 2
+
+        def receive(self, message):
+            received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    received, sent = obs_list(), []
+    blocked_before = mailbox_overflows[BLOCK]
+
+    a = node.spawn(MyActor)
+
+    class Sender(Actor):
+        def receive(self, message):
+            for i in range(5):
+                a << i
+                sent.append(i)
+    node.spawn(Sender) << 'start'
+    sleep(0)
+    eq_(sent, [0, 1])
+    received.wait_eq([0, 1, 2, 3, 4])
+    eq_(sent, [0, 1, 2, 3, 4])
+    ok_(mailbox_overflows[BLOCK] > blocked_before)
+
+
+@deferred_cleanup
+def test_bounded_mailbox_rejects_instead_of_blocking_senders_that_are_not_actors(defer):
+    class MyActor(Actor):
+        mailbox_capacity = 1
+
+        def receive(self, message):
+            released.wait()
+
+    node = DummyNode()
+    defer(node.stop)
+    released = Event()
+    a = node.spawn(MyActor) << 1
+    sleep(0)
+    a << 2
+    with expect_one_event(DeadLetter(a, 3, sender=None)):
+        a << 3
+    released.set()
+
+
+@deferred_cleanup
+def test_bounded_mailbox_does_not_block_the_actor_itself(defer):
+    class MyActor(Actor):
+        mailbox_capacity = 1
+
+        def receive(self, message):
+            if message == 'start':
+                self.ref << 1 << 2 << 3
+            else:
+                received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    received = obs_list()
+    node.spawn(MyActor) << 'start'
+    received.wait_eq([1, 2, 3])
+
+
+@deferred_cleanup
+def test_senders_blocked_on_a_bounded_mailbox_are_released_when_the_actor_stops(defer):
+    class MyActor(Actor):
+        mailbox_capacity = 1
+
+        def receive(self, message):
+            released.wait()
+
+    node = DummyNode()
+    defer(node.stop)
+    released, done = Event(), Event()
+    a = node.spawn(MyActor) << 1
+    sleep(0)
+    a << 2
+
+    class Sender(Actor):
+        def receive(self, message):
+            a << 3
+            done.set()
+    sender = node.spawn(Sender) << 'start'
+    sleep(0)
+    ok_(not done.is_set())
+    dead_letters = []
+    Events.subscribe(DeadLetter, dead_letters.append)
+    a.kill()
+    done.wait()
+    eq_(dead_letters, [DeadLetter(a, 2, sender=None), DeadLetter(a, 3, sender=sender)])
+
+
+##
+## EVENTS
+
+@deferred_cleanup
+def test_each_node_has_its_own_events_passed_on_to_the_process_wide_events(defer):
+    node1, node2 = DummyNode(), DummyNode()
+    defer(node1.stop, node2.stop)
+    a, b = node1.spawn(Actor), node2.spawn(Actor)
+    a.stop()
+    b.stop()
+    idle()
+    events1, all_events = [], []
+    node1.events.subscribe(DeadLetter, events1.append)
+    Events.subscribe(DeadLetter, all_events.append)
+    a << 'foo'
+    b << 'bar'
+    eq_(events1, [DeadLetter(a, 'foo', sender=None)])
+    eq_(all_events, [DeadLetter(a, 'foo', sender=None), DeadLetter(b, 'bar', sender=None)])
+
+
 ##
 ## SPAWNING
 
@@ -325,6 +690,16 @@ def test_sending_to_self_does_not_deliver_the_message_until_after_the_actor_is_s
     message_received.wait()
 
 
+def test_props_using_appends_to_the_existing_positional_arguments():
+    class MyActor(Actor):
+        def __init__(self, *args):
+            pass
+
+    props = MyActor.using('a').using('b', _throughput=3)
+    eq_(props.args, ('a', 'b'))
+    eq_(props.throughput, 3)
+
+
 ##
 ## LIFECYCLE
 
@@ -477,6 +852,29 @@ def test_stop_message_received_twice_is_silently_ignored(defer):
     sleep(.001)
 
 
+@deferred_cleanup
+def test_an_error_escaping_the_step_of_a_cell_stops_the_actor_but_not_the_dispatcher(defer):
+    class Poison(object):
+        def __eq__(self, other):
+            raise MockException()
+
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    received = obs_list()
+    a = node.spawn(MyActor)
+    with expect_failure(MockException):
+        a << (Poison(), 'foo')
+    idle()
+    ok_(a.is_stopped)
+
+    node.spawn(MyActor) << 'bar'
+    received.wait_eq(['bar'])
+
+
 ##
 ## ACTORREFS, URIS & LOOKUP
 
@@ -495,6 +893,71 @@ def test_actors_are_garbage_collected_on_termination(defer):
     ok_(del_called.is_set())
 
 
+@deferred_cleanup
+def test_the_context_of_an_actor_is_reused_and_tracks_the_sender(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            context = get_context()
+            contexts.append((context, context.sender))
+
+    node = DummyNode()
+    defer(node.stop)
+    contexts = obs_list()
+    a, b, c = node.spawn(MyActor), node.spawn(Actor), node.spawn(Actor)
+    a.send('foo', _sender=b)
+    a.send('bar', _sender=c)
+    contexts.wait_eq([ANY, ANY])
+    (context1, sender1), (context2, sender2) = contexts
+    ok_(context1 is context2)
+    eq_((sender1, sender2), (b, c))
+
+
+@deferred_cleanup
+def test_sending_messages_allocates_no_refs(defer):
+    class Echo(Actor):
+        def receive(self, message):
+            self.sender << message
+
+    class Pinger(Actor):
+        def pre_start(self, echo):
+            echo << 0
+
+        def receive(self, message):
+            if message < 100:
+                self.sender << message + 1
+            else:
+                done.set()
+
+    node = DummyNode()
+    defer(node.stop)
+    echo = node.spawn(Echo)
+    idle()
+
+    allocated = []
+    orig_init = Ref.__init__
+
+    def counting_init(self, *args, **kwargs):
+        allocated.append(self)
+        orig_init(self, *args, **kwargs)
+    Ref.__init__ = counting_init
+    defer(lambda: setattr(Ref, '__init__', orig_init))
+
+    done = Event()
+    node.spawn(Pinger.using(echo))
+    done.wait()
+    eq_(len(allocated), 1)  # the ref of the newly spawned pinger
+
+
+@deferred_cleanup
+def test_core_runtime_objects_have_no_instance_dicts(defer):
+    node = DummyNode()
+    defer(node.stop)
+    a = node.spawn(Actor)
+    for obj in [a, a.uri, a._cell, a._cell.mailbox, DeadLetter(a, 'dummy', sender=None)]:
+        with assert_raises(AttributeError):
+            obj.some_attribute = 1
+
+
 @deferred_cleanup
 def test_cells_are_garbage_collected_on_termination(defer):
     node = DummyNode()
@@ -764,6 +1227,27 @@ def test_uri_hash():
     eq_(hash(Uri.parse('localhost:123/foo')), hash(Uri.parse('localhost:123/foo')))
 
 
+def test_uris_are_immutable_and_parsing_is_cached():
+    uri = Uri.parse('localhost:123/foo/bar')
+    with assert_raises(AttributeError):
+        uri.name = 'baz'
+    ok_(Uri.parse('localhost:123/foo/bar') is uri)
+    eq_(uri, Uri(name='bar', parent=Uri(name='foo', parent=Uri(name='', parent=None, node='localhost:123'))))
+    eq_(hash(uri), hash(Uri.parse('localhost:123') / 'foo' / 'bar'))
+    ok_(uri != 'localhost:123/foo')
+
+
+def test_uris_can_be_copied_and_pickled():
+    for addr in ['', '/foo', 'foo/bar', 'localhost:123', 'localhost:123/foo/bar']:
+        uri = Uri.parse(addr)
+        copies = [copy.copy(uri), copy.deepcopy(uri)] + [pickle.loads(pickle.dumps(uri, protocol))
+                                                         for protocol in (0, 1, 2)]
+        for other in copies:
+            eq_(other, uri)
+            eq_((other.node, other.path, other.steps), (uri.node, uri.path, uri.steps))
+            eq_(hash(other), hash(uri))
+
+
 ## LOOKUP
 
 @deferred_cleanup
@@ -824,6 +1308,44 @@ def test_looking_up_a_non_existent_local_actor_raises_runtime_error(defer):
         node.guardian / 'noexist'
 
 
+@deferred_cleanup
+def test_unresolved_local_refs_deliver_through_the_node_wide_index_of_cells(defer):
+    class Parent(Actor):
+        def pre_start(self):
+            self.spawn(MockActor.using(received), name='child')
+
+    node = DummyNode()
+    defer(node.stop)
+    received = obs_list()
+    parent = node.spawn(Parent, name='parent')
+    idle()
+    eq_(sorted(node.guardian.cells), ['/parent', '/parent/child'])
+
+    unresolved = Ref(cell=None, uri=Uri.parse('/parent/child'), node=node, is_local=True)
+    unresolved << 'foo' << 'bar'
+    received.wait_eq(['foo', 'bar'])
+    ok_(not unresolved._cell, "the ref should not hold on to the cell")
+
+    parent.stop()
+    idle()
+    eq_(node.guardian.cells, {})
+    with expect_one_event(DeadLetter(unresolved, 'baz', sender=None)):
+        unresolved << 'baz'
+
+
+@deferred_cleanup
+def test_spawning_from_an_actor_after_its_node_has_stopped_fails(defer):
+    node = DummyNode()
+    defer(node.stop)
+    guardian, cell = node.guardian, node.spawn(Actor, name='a')._cell
+    node.stop()
+
+    with assert_raises(RuntimeError):
+        cell.spawn_actor(Actor, name='b')
+    ok_('/a/b' not in guardian.cells)
+    ok_(not cell.get_child('b'))
+
+
 # def test_looking_up_a_non_existent_local_actor_returns_a_dead_ref_with_nevertheless_correct_uri():
 #     network = MockNetwork(Clock())
 #     node = network.node('local:123')
@@ -1414,6 +1936,166 @@ def test_messages_sent_to_nonexistent_remote_actors_are_deadlettered(defer):
 test_messages_sent_to_nonexistent_remote_actors_are_deadlettered.timeout = 3.0
 
 
+@deferred_cleanup
+def test_remote_messages_are_sent_in_batches_in_order(defer):
+    sender_node = Node('localhost:20001', enable_remoting=True, hub_kwargs={'batch_window': 0.01, 'batch_max_bytes': 500})
+    receiver_node = Node('localhost:20002', enable_remoting=True)
+    defer(sender_node.stop, receiver_node.stop)
+
+    class RecordingSocket(object):
+        def __init__(self, sock):
+            self.sock, self.frames = sock, []
+
+        def send_multipart(self, frame):
+            self.frames.append(frame)
+            return self.sock.send_multipart(frame)
+
+        def __getattr__(self, name):
+            return getattr(self.sock, name)
+    sender_node._hub._outsock = sock = RecordingSocket(sender_node._hub._outsock)
+
+    msgs = obs_list()
+    receiver_node.spawn(Props(MockActor, msgs), name='actor')
+    ref = sender_node.lookup_str('localhost:20002/actor')
+    for i in range(100):
+        ref << i
+    msgs.wait_eq(range(100))
+    for i in range(100, 200):
+        ref << i
+    msgs.wait_eq(range(200))
+
+    # a frame is either a ping `(nid, header)`, a lone message `(nid, header + msg)` or a batch `(nid, header, msgs...)`
+    frames = [frame for frame in sock.frames if len(frame) > 2 or len(frame[1]) > 4]
+    batches = [frame for frame in frames if len(frame) > 2]
+    eq_(sum(len(frame) - 2 if len(frame) > 2 else 1 for frame in frames), 200)
+    ok_(batches and len(frames) <= 200 / 10, "%d messages sent in %d frames" % (200, len(frames)))
+    ok_(all(len(frame[1]) == 4 for frame in batches), "batches share a single version header")
+test_remote_messages_are_sent_in_batches_in_order.timeout = 3.0
+
+
+@deferred_cleanup
+def test_remote_messages_to_a_full_bounded_mailbox_are_rejected_without_holding_up_the_node(defer):
+    class Slow(Actor):
+        mailbox_capacity = 1
+
+        def receive(self, message):
+            started.append(message)
+            released.wait()
+            received.append(message)
+
+    sender_node = Node('localhost:20001', enable_remoting=True)
+    receiver_node = Node('localhost:20002', enable_remoting=True)
+    defer(sender_node.stop, receiver_node.stop)
+    started, received, others, released = obs_list(), obs_list(), obs_list(), Event()
+    slow = receiver_node.spawn(Slow, name='slow')
+    receiver_node.spawn(Props(MockActor, others), name='other')
+
+    remote_slow = sender_node.lookup_str('localhost:20002/slow')
+    remote_slow << 1
+    started.wait_eq([1])
+    with expect_one_event(DeadLetter(slow, 3, sender=None)):
+        remote_slow << 2 << 3
+        sender_node.lookup_str('localhost:20002/other') << 'not-held-up'
+        others.wait_eq(['not-held-up'])
+    released.set()
+    received.wait_eq([1, 2])
+test_remote_messages_to_a_full_bounded_mailbox_are_rejected_without_holding_up_the_node.timeout = 3.0
+
+
+@deferred_cleanup
+def test_a_node_that_lost_the_ids_of_the_paths_sent_to_it_has_them_defined_anew(defer):
+    sender_node = Node('localhost:20001', enable_remoting=True)
+    receiver_node = Node('localhost:20002', enable_remoting=True)
+    defer(sender_node.stop, receiver_node.stop)
+
+    msgs = obs_list()
+    receiver_node.spawn(Props(MockActor, msgs), name='actor')
+    ref = sender_node.lookup_str('localhost:20002/actor')
+    ref << 'first'
+    msgs.wait_eq(['first'])
+    receiver_node._hub._names.clear()  # as if the receiver had restarted unnoticed
+    # with its path unknown, the recipient of the message is only known to be on the receiving node
+    node_ref = Ref(cell=None, uri=Uri.parse('localhost:20002'), node=receiver_node, is_local=True)
+    with expect_one_event(DeadLetter(node_ref, 'lost', sender=None)):
+        ref << 'lost'
+    while 'localhost:20002' in sender_node._hub._ids:
+        sleep(0.01)
+    ref << 'second'
+    msgs.wait_eq(['first', 'second'])
+test_a_node_that_lost_the_ids_of_the_paths_sent_to_it_has_them_defined_anew.timeout = 3.0
+
+
+@deferred_cleanup
+def test_messages_arriving_over_another_connection_before_the_ids_they_use_are_still_delivered(defer):
+    sender_node = Node('localhost:20001', enable_remoting=True)
+    receiver_node = Node('localhost:20002', enable_remoting=True)
+    defer(sender_node.stop, receiver_node.stop)
+
+    msgs = obs_list()
+    receiver_node.spawn(Props(MockActor, msgs), name='actor')
+    ref = sender_node.lookup_str('localhost:20002/actor')
+    # the path gets defined over the connection made by the sender, and is then sent over the one made by the
+    # receiver, or through a relay, either of which can overtake the definition
+    sender_ids = lambda use_sock: sender_node._hub._ids_for('localhost:20002', use_sock)
+    defining = _Msg(ref, 'defining', None).serialize(sender_ids(OUT))
+    overtaking = _Msg(ref, 'overtaking', None).serialize(sender_ids(IN))
+    relayed = _Msg(ref, 'relayed', None).serialize()
+    for on_sock, msg_bytes in [(OUT, overtaking), (None, relayed), (IN, defining)]:
+        receiver_node._hub._execute(lambda: [(Receive, on_sock, 'localhost:20001', msg_bytes)])
+    msgs.wait_eq(['overtaking', 'relayed', 'defining'])
+
+
+@deferred_cleanup
+def test_sending_a_remote_message_does_not_wait_for_the_network(defer):
+    node = Node('localhost:20001', enable_remoting=True)
+    defer(node.stop)
+    ran = []
+    spawn(ran.append, True)
+    node.lookup_str('localhost:20002/actor') << 'connects-first'
+    node.lookup_str('localhost:20002/actor') << 'queued'
+    ok_(not ran)
+
+
+@deferred_cleanup
+def test_messages_sent_to_a_node_whose_host_does_not_resolve_are_deadlettered_right_away(defer):
+    node = Node('localhost:20001', enable_remoting=True)
+    defer(node.stop)
+    ref = node.lookup_str('no-such-host.invalid:20002/actor')
+    with expect_one_event(DeadLetter(ref, 'foo', sender=None), timeout=0.3):
+        ref << 'foo'
+
+
+@deferred_cleanup
+def test_messages_sent_to_a_node_whose_host_fails_to_resolve_in_any_way_are_deadlettered(defer):
+    def gethostbyname(host):
+        raise UnicodeError("label too long")
+
+    node = Node('localhost:20001', enable_remoting=True)
+    defer(node.stop)
+    node._hub.resolver = Resolver(ttl=0.0, negative_ttl=0.0, gethostbyname=gethostbyname)
+    ref = node.lookup_str('bad-host:20002/actor')
+    with expect_one_event(DeadLetter(ref, 'foo', sender=None), timeout=0.3):
+        ref << 'foo'
+    ok_(not node._hub._writer.ready())
+
+
+@deferred_cleanup
+def test_stopping_a_node_while_connecting_to_a_host_that_does_not_resolve(defer):
+    def gethostbyname(host):
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+    node = Node('localhost:20001', enable_remoting=True)
+    defer(node.stop)
+    hub = node._hub
+    hub.resolver = Resolver(gethostbyname=gethostbyname)
+    hub.resolver.resolve('bad-host')
+    ref = node.lookup_str('bad-host:20002/actor')
+    with expect_one_event(DeadLetter(ref, 'foo', sender=None)):
+        ref << 'foo'  # the writer only gets to the connecting after the node has started stopping
+        node.stop()
+    ok_(hub._writer.successful())
+
+
 ## HEARTBEAT
 
 @deferred_cleanup
@@ -1765,6 +2447,28 @@ def test_stashed_messages_are_received_in_the_order_they_were_sent(defer):
     eq_(msgs_received, [1, 3, 2])
 
 
+@deferred_cleanup
+def test_stashed_messages_are_found_by_tag_and_arity_in_the_order_they_were_sent(defer):
+    class MyProc(Actor):
+        def run(self):
+            msgs_received.append(self.get('c'))
+            msgs_received.append(self.get(('a', ANY)))
+            msgs_received.append(self.get((ANY, 2)))
+            msgs_received.append(self.get(IS_INSTANCE(tuple)))
+            msgs_received.append(self.get(('a', ANY, ANY)))
+            msgs_received.append(self.get())
+            done.set()
+
+    node = DummyNode()
+    defer(node.stop)
+    msgs_received = []
+    done = Event()
+    a = node.spawn(MyProc)
+    a << ('b', 1) << ('a', 1) << 'x' << ('b', 2) << ('a', 2) << ('a', 1, 2) << 'c'
+    done.wait()
+    eq_(msgs_received, ['c', ('a', 1), ('b', 2), ('b', 1), ('a', 1, 2), 'x'])
+
+
 @deferred_cleanup
 def test_process_is_stopped_when_run_returns(defer):
     class MyProc(Actor):
@@ -1,13 +1,15 @@
+import socket
 import uuid
 import random
 
-from nose.tools import ok_
+from nose.tools import ok_, eq_
 
 from spinoff.util.testing.actor import wrap_globals
 from spinoff.remoting.hublogic import (
     HubLogic, Connect, Disconnect, NodeDown, Ping, Send, Receive, SendFailed, SigDisconnect,
     RelayConnect, RelaySend, RelaySigNodeDown, RelaySigConnected, RelayForward, RelaySigNew, RelayNvm,
     NextBeat, IN, OUT, flatten, nid2addr)
+from spinoff.remoting.hub import Resolver, _UNRESOLVED
 from spinoff.util.pattern_matching import ANY
 
 
@@ -109,6 +111,15 @@ def test_failed_connect_and_then_successful_connect(t=Time, logic=DEFAULT_LOGIC,
     t, logic = test_successful_connect(lambda: t, lambda: logic, nid=nid)
 
 
+def test_connect_failed(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
+    t, logic = t(), logic()
+    msg = object()
+    emits_(logic.send_message(nid, msg, t=t.current), [(Connect, nid2addr(nid)), (Ping, OUT, nid, ANY)])
+    emits_(logic.connect_failed(nid2addr(nid)), [(SendFailed, msg), (NodeDown, nid)])
+    # silence
+    emits_(logic.heartbeat(t=t.advance(by=logic.heartbeat_max_silence)), [(NextBeat, 1.0)])
+
+
 #
 
 
@@ -148,10 +159,16 @@ def test_receive_ping_with_no_prior_connection(t=Time, logic=DEFAULT_LOGIC, nid=
 
 def test_receive_message_with_no_prior_connection(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
     t, logic, msg = t(), logic(), object()
-    emits_(logic.message_received(IN, nid, 1, msg, t=t.current), [(Ping, IN, nid, 0), (Receive, nid, msg)])
+    emits_(logic.message_received(IN, nid, 1, msg, t=t.current), [(Ping, IN, nid, 0), (Receive, IN, nid, msg)])
     return t, logic
 
 
+def test_receive_batch_of_messages_with_no_prior_connection(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
+    t, logic, msg1, msg2 = t(), logic(), random_bytes(), random_bytes()
+    emits_(logic.batch_received(IN, nid, 1, [msg1, msg2], t=t.current),
+           [(Ping, IN, nid, 0), (Receive, IN, nid, msg1), (Receive, IN, nid, msg2)])
+
+
 def test_receiving_ping_from_nil_means_the_connection_will_be_reused(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
     (t, logic), msg = test_receive_ping_with_no_prior_connection(t, logic, nid=nid), object()
     emits_(logic.send_message(nid, msg, t=t.current), [(Send, IN, nid, ANY, msg)])
@@ -172,6 +189,15 @@ def test_shutdown_sigdisconnects(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:12
     emits_(logic.shutdown(), [(SigDisconnect, OUT, nid)])
 
 
+def test_unknown_ids_are_reported_back_to_the_sender(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
+    notice = object()
+    emits_(logic().unknown_ids_received(nid, notice), [])
+    t, logic = test_successful_connect(t, logic, nid=nid)
+    emits_(logic.unknown_ids_received(nid, notice), [(Send, OUT, nid, ANY, notice)])
+    t, logic = test_receive_message_with_no_prior_connection(Time, DEFAULT_LOGIC, nid=nid)
+    emits_(logic.unknown_ids_received(nid, notice), [(Send, IN, nid, ANY, notice)])
+
+
 # relay
 
 def test_relay_failed_connect_request(t=Time, logic=DEFAULT_LOGIC, cat=NID('cat:321'), mouse=NID('mouse:321')):
@@ -292,7 +318,7 @@ def test_relay_propagates_on_incoming_connection(t=Time, logic=RELAY_LOGIC, mous
 
 def test_relay_propagates_on_incoming_message(t=Time, logic=RELAY_LOGIC, mouse=NID('mouse:123')):
     t, logic, msg = t(), logic(), object()
-    emits_(logic.message_received(IN, mouse, 1, msg, t.current), [(RelaySigNew, IN, mouse), (Ping, IN, mouse, ANY), (Receive, mouse, msg)])
+    emits_(logic.message_received(IN, mouse, 1, msg, t.current), [(RelaySigNew, IN, mouse), (Ping, IN, mouse, ANY), (Receive, IN, mouse, msg)])
 
 
 def test_relay_propagates_on_outgoing_connection(t=Time, logic=RELAY_LOGIC, mouse=NID('mouse:123')):
@@ -377,7 +403,7 @@ def test_after_successful_relayed_connect_queue_is_sent_and_subsequent_sends_do_
 
 def test_relayed_message_received(t=Time, logic=DEFAULT_LOGIC, mouse=NID('mouse:456')):
     t, logic, msg = t(), logic(), object()
-    emits_(logic.relay_forwarded_received(mouse, msg), [(Receive, mouse, msg)])
+    emits_(logic.relay_forwarded_received(mouse, msg), [(Receive, None, mouse, msg)])
     return t, logic
 
 
@@ -408,6 +434,26 @@ def test_2_nodes_talking_over_different_relays_choose_one_and_the_same_relay_and
 
 #
 
+def test_resolver_caches_resolved_and_unresolvable_hosts():
+    lookups = []
+
+    def gethostbyname(host):
+        lookups.append(host)
+        if host == 'nowhere':
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return '10.0.0.1'
+
+    resolver = Resolver(ttl=60.0, negative_ttl=0.0, gethostbyname=gethostbyname)
+    ok_(resolver.get('somewhere') is _UNRESOLVED)
+    eq_(resolver.resolve('somewhere'), '10.0.0.1')
+    eq_(resolver.get('somewhere'), '10.0.0.1')
+    eq_(resolver.resolve('somewhere'), '10.0.0.1')
+    eq_(resolver.resolve('nowhere'), None)
+    eq_(resolver.resolve('nowhere'), None)  # failures expire immediately with `negative_ttl=0`
+    eq_(resolver.get('127.0.0.1'), '127.0.0.1')
+    eq_(lookups, ['somewhere', 'nowhere', 'nowhere'])
+
+
 def emits_(gen, expected_actions):
     assert isinstance(expected_actions, list)
     actions = list(flatten(gen))
@@ -0,0 +1,102 @@
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+from StringIO import StringIO
+
+from nose.tools import eq_, ok_
+
+from spinoff.util.logging import logging
+
+
+def with_outfile(fn):
+    def ret():
+        logging.flush()
+        outfile, level = logging.OUTFILE, logging.LEVEL
+        logging.OUTFILE = StringIO()
+        try:
+            fn(logging.OUTFILE)
+        finally:
+            logging.OUTFILE, logging.LEVEL = outfile, level
+    ret.__name__ = fn.__name__
+    return ret
+
+
+@with_outfile
+def test_records_below_the_level_are_not_even_recorded(outfile):
+    class Arg(object):
+        def __repr__(self):
+            assert False, "should not be formatted"
+
+    logging.LEVEL = 1
+    logging.dbg(Arg())
+    eq_(len(logging._records), 0)
+    logging.flush()
+    eq_(outfile.getvalue(), '')
+
+
+@with_outfile
+def test_errors_are_written_out_right_away_with_everything_logged_before(outfile):
+    logging.log('first')
+    logging.err('second')
+    lines = outfile.getvalue().splitlines()
+    eq_(len(lines), 2)
+    ok_('first' in lines[0] and 'second' in lines[1])
+
+
+@with_outfile
+def test_records_are_formatted_in_the_background(outfile):
+    logging.log('hello')
+    for _ in range(100):
+        if outfile.getvalue():
+            break
+        time.sleep(0.01)
+    ok_('hello' in outfile.getvalue())
+
+
+@with_outfile
+def test_mutable_arguments_are_logged_as_of_the_time_of_the_call(outfile):
+    state = {'count': 1}
+    logging.log(state)
+    state['count'] = 2
+    state['other'] = 3
+    logging.flush()
+    ok_("{'count': 1}" in outfile.getvalue())
+
+
+@with_outfile
+def test_fmt_arguments_are_logged_as_of_the_time_of_the_call(outfile):
+    state = {'count': 1}
+    logging.log(logging.fmt("state: %r", state))
+    state['count'] = 2
+    logging.flush()
+    ok_("state: {'count': 1}" in outfile.getvalue())
+
+
+@with_outfile
+def test_fmt_is_only_formatted_if_the_record_is_not_filtered_out(outfile):
+    class Arg(object):
+        formatted = 0
+
+        def __repr__(self):
+            Arg.formatted += 1
+            return 'Arg()'
+
+    logging.LEVEL = 1
+    logging.dbg(logging.fmt("%r", Arg()))
+    eq_(Arg.formatted, 0)
+
+    logging.LEVEL = 0
+    logging.dbg(logging.fmt(u"%r \u2192 %s", Arg(), "dst"))
+    eq_(Arg.formatted, 1)
+    logging.flush()
+    ok_('Arg() \xe2\x86\x92 dst' in outfile.getvalue())
+
+
+def test_debug_logging_is_compiled_out_in_production_mode():
+    output = subprocess.check_output(
+        [sys.executable, '-c', 'from spinoff.util.logging import logging; print(logging.dbg is logging._noop)'],
+        env=dict(os.environ, SPINOFF_PRODUCTION='1'))
+    eq_(output.strip(), 'True')
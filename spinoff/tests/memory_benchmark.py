@@ -0,0 +1,47 @@
+"""Reports the memory used per idle actor.
+
+Run with `python -m spinoff.tests.memory_benchmark [NUM_ACTORS]`.
+
+"""
+from __future__ import print_function
+
+import gc
+import resource
+import sys
+
+from gevent import idle
+
+from spinoff.actor import Actor, Node
+
+
+class IdleActor(Actor):
+    def receive(self, message):
+        pass
+
+
+def max_rss():
+    # `ru_maxrss` is in kilobytes on Linux but in bytes on OS X
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def measure(num_actors):
+    node = Node()
+    try:
+        refs = []
+        gc.collect()
+        before = max_rss()
+        for _ in xrange(num_actors):
+            refs.append(node.spawn(IdleActor))
+        idle()  # let all of the actors start
+        for ref in refs:
+            ref << 'ping'
+        idle()
+        gc.collect()
+        return (max_rss() - before) / num_actors
+    finally:
+        node.stop()
+
+
+if __name__ == '__main__':
+    num_actors = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("%d bytes per idle actor (%d actors)" % (measure(num_actors), num_actors))
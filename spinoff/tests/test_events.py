@@ -1,4 +1,6 @@
-from spinoff.actor.events import Events, Terminated, Error
+from spinoff.actor.events import Events, EventBus, Event, Terminated, Error, DeadLetter, Throttle
+from spinoff.actor.uri import Uri
+from spinoff.util.logging import flush
 
 
 def test_basic():
@@ -17,3 +19,69 @@ def test_subscribe_and_unsubscribe():
     event = Error('actor', 1, 2)
     Events.log(event)
     assert errors == []
+
+
+def test_subscribing_to_a_base_class_gets_the_events_of_all_subclasses():
+    events = []
+    Events.subscribe(Event, events.append)
+    Events.log(Terminated('actor'))
+    Events.log(Error('actor', 1, 2))
+    assert events == [Terminated('actor'), Error('actor', 1, 2)]
+
+    events[:] = []
+    Events.unsubscribe(Event, events.append)
+    Events.log(Terminated('actor'))
+    assert events == []
+
+
+def test_subscribing_to_the_events_of_the_actors_under_a_path():
+    class FakeRef(object):
+        def __init__(self, path):
+            self.uri = Uri.parse(path)
+
+    events = []
+    Events.subscribe(DeadLetter, events.append, under='/foo')
+    foo, foo_bar, foobar = FakeRef('/foo'), FakeRef('localhost:123/foo/bar'), FakeRef('/foobar')
+    for actor in [foo, foo_bar, foobar]:
+        Events.log(DeadLetter(actor, 'msg', None))
+    assert events == [DeadLetter(foo, 'msg', None), DeadLetter(foo_bar, 'msg', None)]
+    Events.unsubscribe(DeadLetter, events.append, under='/foo')
+
+
+def test_events_of_actors_given_as_strings_that_are_not_uris_are_still_delivered():
+    events, delivered = EventBus(), []
+    events.subscribe(DeadLetter, delivered.append)
+    events.subscribe(DeadLetter, delivered.append, under='/foo')
+    events.log(DeadLetter('not a uri/', 'msg', None))
+    assert delivered == [DeadLetter('not a uri/', 'msg', None)]
+
+
+def test_repeated_dead_letters_are_counted_instead_of_logged_but_still_delivered():
+    class Message(object):
+        reprs = 0
+
+        def __repr__(self):
+            Message.reprs += 1
+            return 'Message()'
+
+    events = EventBus()
+    events.throttle = Throttle(window=60, burst=2)
+    delivered = []
+    events.subscribe(DeadLetter, delivered.append)
+    for _ in range(5):
+        events.log(DeadLetter('actor', ('tag', Message()), None))
+    assert len(delivered) == 5
+    flush()
+    assert Message.reprs == 2
+    assert events.throttle.suppressed == 3
+
+    events.log(DeadLetter('other-actor', ('tag', Message()), None))
+    events.log(DeadLetter('actor', ('other-tag', Message()), None))
+    flush()
+    assert Message.reprs == 4
+
+    events.throttle.flush()
+    assert not events.throttle.counts
+    events.log(DeadLetter('actor', ('tag', Message()), None))
+    flush()
+    assert Message.reprs == 5
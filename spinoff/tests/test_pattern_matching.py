@@ -1,5 +1,7 @@
+import inspect
+
 from spinoff.util.testing import assert_not_raises
-from spinoff.util.pattern_matching import match, ANY, IGNORE, IS_INSTANCE, NOT
+from spinoff.util.pattern_matching import match, ANY, IGNORE, IS_INSTANCE, NOT, PatternTable, IN, EQ, OR
 
 
 FLATTEN = True
@@ -126,3 +128,73 @@ def test_or():
     assert (IS_INSTANCE(int) | IS_INSTANCE(float)) == 3
     assert (IS_INSTANCE(int) | IS_INSTANCE(float)) == 3.3
     assert not ((IS_INSTANCE(int) | IS_INSTANCE(float)) == 'hello')
+
+
+def test_pattern_table():
+    table = PatternTable([
+        (('foo', ANY), 1),
+        ((IS_INSTANCE(int), 'x'), 2),
+        (('foo', 'bar', ANY), 3),
+        ('foo', 4),
+        ((ANY, ANY), 5),
+        (IS_INSTANCE(str), 6),
+        (('foo', 'baz'), 7),
+    ])
+    assert table.find(('foo', 'x')) == 1
+    assert table.find((1, 'x')) == 2
+    assert table.find(('foo', 'bar', 'baz')) == 3
+    assert table.find(('bar', 'bar', 'baz')) is None
+    assert table.find('foo') == 4
+    assert table.find(('bar', 'x')) == 5
+    assert table.find(([], 'x')) == 5, "unhashable heads fall back to the non-indexed patterns"
+    assert table.find('bar') == 6
+    assert table.find(('foo', 'baz')) == 1, "the first matching pattern wins"
+    assert table.find(123, default='none') == 'none'
+    assert table.find([1, 2]) is None
+
+
+def test_building_matchers_does_not_inspect_their_constructors():
+    calls = []
+    orig_getargspec = inspect.getargspec
+    inspect.getargspec = lambda fn: calls.append(fn) or orig_getargspec(fn)
+    try:
+        for i in xrange(1000):
+            IN([i]), EQ(i), OR(ANY, EQ(i))
+            assert EQ(i, i) is True, "matchers can still be built and applied in one go"
+    finally:
+        inspect.getargspec = orig_getargspec
+    assert not calls, "getargspec was called %d times" % (len(calls),)
+
+
+def test_in():
+    assert IN([1, 2]) == 2
+    assert IN([1, 2]) != 3
+    assert IN([[1], 2]) == [1], "unhashable options are supported"
+    assert IN([IS_INSTANCE(int), 'foo']) == 3, "matchers among the options are supported"
+    assert IN(set([1])) != [1], "unhashable subjects just don't match"
+
+    live = set()
+    matcher = IN(live)
+    assert matcher != 1
+    live.add(1)
+    assert matcher == 1, "sets and dicts are not copied"
+
+    options = [1]
+    matcher = IN(options)
+    options.append(2)
+    assert matcher != 2, "other collections are snapshot"
+
+    class P(object):
+        def __init__(self, x):
+            self.x = x
+
+        def __eq__(self, other):
+            return isinstance(other, P) and other.x == self.x
+
+        def __ne__(self, other):
+            return not (self == other)
+
+    assert IN([P(1)]) == P(1), "options with a custom __eq__ but identity hashing are compared with =="
+    assert IN((P(1), P(2))) != P(3)
+    assert (IN([P(1)]), ANY) == (P(1), 'x'), "also inside tuple patterns"
+    assert PatternTable([((IN([P(1)]), ANY), 'hit')]).find((P(1), 'x')) == 'hit'
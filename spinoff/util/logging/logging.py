@@ -1,8 +1,8 @@
 # coding: utf8
 from __future__ import print_function, absolute_import
 
+import atexit
 import datetime
-import inspect
 import re
 import sys
 import time
@@ -10,7 +10,8 @@ import traceback
 import types
 import os
 import multiprocessing
-from collections import defaultdict
+import threading
+from collections import defaultdict, deque
 from spinoff.util.python import dump_method_call
 
 try:
@@ -76,6 +77,20 @@ else:
 OUTFILE = sys.stderr
 LEVEL = 0
 
+# log records are written out by a background thread so that logging never blocks on `OUTFILE`. Only the arguments
+# that can't change in the meantime, i.e. strings and numbers, are formatted there; everything else, `fmt`s included,
+# is formatted right away by the code logging it. Errors (`err` and worse) are the exception: they are written out right away,
+# together with anything logged before them, so logging an error does block until it is out. With `ASYNC = False`,
+# every record is written out right away by the code logging it.
+ASYNC = True
+# the number of records that can be waiting to be written out before the oldest ones get dropped
+RING_SIZE = 10000
+
+# in production mode, selected by setting `SPINOFF_PRODUCTION` in the environment before this module is imported,
+# debug logging is compiled out: `dbg` and its variants are bound to no-ops and `logstring` leaves the functions it
+# decorates untouched. See also `set_production`.
+PRODUCTION = bool(os.environ.get('SPINOFF_PRODUCTION'))
+
 ENABLE_ONLY = False
 
 
@@ -96,7 +111,8 @@ LEVELS = [(name.ljust(5), style) for name, style in LEVELS]
 
 
 def dbg(*args, **kwargs):
-    _write(0, *args, **kwargs)
+    if LEVEL <= 0:
+        _write(0, *args, **kwargs)
 
 
 def dbg_call(fn, *args, **kwargs):
@@ -108,7 +124,8 @@ def dbg_call(fn, *args, **kwargs):
 
 
 def dbg1(*args, **kwargs):
-    _write(0, end='', *args, **kwargs)
+    if LEVEL <= 0:
+        _write(0, end='', *args, **kwargs)
 
 
 # def dbg2(*args, **kwargs):
@@ -116,7 +133,8 @@ def dbg1(*args, **kwargs):
 
 
 def dbg3(*args, **kwargs):
-    _write(0, end='\n', *args, **kwargs)
+    if LEVEL <= 0:
+        _write(0, end='\n', *args, **kwargs)
 
 
 def log(*args, **kwargs):
@@ -163,86 +181,190 @@ def get_calling_context(frame):
 
 
 def _write(level, *args, **kwargs):
-    _lock.acquire()
+    # only what can't be done later is done here: the record is formatted and written by the writer thread
+    if level < LEVEL:
+        return
     try:
-        if level >= LEVEL:
-
-            frame = sys._getframe(2)
-            file, lineno, caller_name, caller = get_calling_context(frame)
-
-            if caller:
-                caller_module = caller.__module__
-                cls_name = caller.__name__ if isinstance(caller, type) else type(caller).__name__
-                caller_full_path = '%s.%s' % (caller_module, cls_name)
-            else:
-                # TODO: find a faster way to get the module than inspect.getmodule
-                caller = inspect.getmodule(frame)
-                if caller:
-                    caller_full_path = caller_module = caller.__name__
-                else:
-                    caller_full_path = caller_module = ''  # .pyc
-
-            if ENABLE_ONLY and not any(re.match(x, caller_full_path) for x in ENABLE_ONLY):
-                return
-
-            caller_fn = getattr(caller, caller_name, None)
-
-            logstring = getattr(caller_fn, '_r_logstring', None) if caller_fn else None
-            if not logstring:
-                # TODO: add logstring "inheritance"
-                logstring = getattr(caller_fn, '_logstring', None)
-                if logstring:
-                    if isinstance(logstring, unicode):
-                        logstring = logstring.encode('utf8')
-                else:
-                    logstring = caller_name + (':' if args else '')
-
-                logstring = YELLOW + logstring + RESET_COLOR
-
-                # cache it
-                if isinstance(caller_fn, types.MethodType):
-                    caller_fn.im_func._r_logstring = logstring
-                elif caller_fn:
-                    caller_fn._r_logstring = logstring
-
-            logname = getattr(caller, '_r_logname', None) if caller else ''
-            if logname is None:
-                logname = CYAN + get_logname(caller) + RESET_COLOR
-                if not hasattr(caller, '__slots__'):
-                    caller._r_logname = logname
-
-            statestr = GREEN + ' '.join(k for k, v in get_logstate(caller).items() if v) + RESET_COLOR
-
-            comment = get_logcomment(caller)
-
-            file = os.path.split(file)[-1]
-            loc = "%s:%s" % (file, lineno)
-            if level >= 9:  # blink for panics
-                loc = BLINK + loc + RESET_COLOR
-
-            levelname = LEVELS[level][1] + LEVELS[level][0] + RESET_COLOR
-
-            dump_parent_caller = kwargs.pop('caller', False)
-            # args = tuple(x.encode('utf-8') for x in args if isinstance(x, unicode))
-            print(("%s %s %s %s %s %s in %s" %
-                  (datetime.datetime.strftime(datetime.datetime.utcfromtimestamp(time.time() - time.timezone), "%X.%f"), os.getpid(), levelname, loc, logname, statestr, logstring)),
-                  file=OUTFILE, *(args + (comment,)))
-            if dump_parent_caller:
-                parent_frame = frame
-                for i in range(dump_parent_caller):
-                    parent_frame = parent_frame.f_back
-                    if not parent_frame:
-                        break
-                    file_, lineno, caller_name, caller = get_calling_context(parent_frame)
-                    loc = "%s:%s" % (file_, lineno)
-                    print(" " * (i + 1) + "(invoked by) %s  %s  %s" % (get_logname(caller), caller_name, loc), file=OUTFILE)
+        frame = sys._getframe(2)
+        context = get_calling_context(frame)
+        caller = context[3]
+
+        if ENABLE_ONLY and not any(re.match(x, _get_caller_full_path(frame, caller)) for x in ENABLE_ONLY):
+            return
+
+        dump_parent_caller = kwargs.pop('caller', False)
+        parents = _get_parent_contexts(frame, dump_parent_caller) if dump_parent_caller else ()
+
+        # the record must not refer to anything that can change before the writer gets to it, so the caller, its state
+        # and any mutable arguments are all formatted as of the time of the call
+        logstate, logcomment = getattr(caller, 'logstate', None), getattr(caller, 'logcomment', None)
+        record = (time.time(), level, context[:2], _get_logname_and_logstring(frame, context, bool(args)),
+                  tuple(x if isinstance(x, _DEFERRABLE) else str(x) for x in args), kwargs,
+                  get_logstate(caller) if logstate else {}, get_logcomment(caller) if logcomment else '',
+                  [(file, lineno, caller_name, get_logname(caller)) for file, lineno, caller_name, caller in parents])
     except Exception:
-        # from nose.tools import set_trace; set_trace()
         print(RED, "!!%d: (logger failure)" % (level,), file=sys.stderr, *args, **kwargs)
-        print(RED, "...while trying to log", repr(args), repr(comment) if 'comment' in locals() else '')
         print(traceback.format_exc(), RESET_COLOR, file=sys.stderr)
-    finally:
-        _lock.release()
+        return
+
+    if not ASYNC:
+        _records.append(record)
+        flush()
+        return
+    if len(_records) == _records.maxlen:
+        _dropped[0] += 1
+    _records.append(record)
+    if level >= 7:  # errors are written out right away, together with anything logged before them
+        flush()
+    elif not _pending.is_set():
+        if _writer_pid != os.getpid():
+            _start_writer()
+        _pending.set()
+
+
+def _get_caller_full_path(frame, caller):
+    if caller:
+        cls_name = caller.__name__ if isinstance(caller, type) else type(caller).__name__
+        return '%s.%s' % (caller.__module__, cls_name)
+    else:
+        return frame.f_globals.get('__name__', '')
+
+
+def _get_parent_contexts(frame, depth):
+    ret = []
+    for _ in range(depth):
+        frame = frame.f_back
+        if not frame:
+            break
+        ret.append(get_calling_context(frame))
+    return ret
+
+
+def _get_logname_and_logstring(frame, context, has_args):
+    _, _, caller_name, caller = context
+    if not caller:
+        caller = sys.modules.get(frame.f_globals.get('__name__'))
+
+    caller_fn = getattr(caller, caller_name, None)
+
+    logstring = getattr(caller_fn, '_r_logstring', None) if caller_fn else None
+    if not logstring:
+        # TODO: add logstring "inheritance"
+        logstring = getattr(caller_fn, '_logstring', None)
+        if logstring:
+            if isinstance(logstring, unicode):
+                logstring = logstring.encode('utf8')
+        else:
+            logstring = caller_name + (':' if has_args else '')
+
+        logstring = YELLOW + logstring + RESET_COLOR
+
+        # cache it
+        if isinstance(caller_fn, types.MethodType):
+            caller_fn.im_func._r_logstring = logstring
+        elif caller_fn:
+            caller_fn._r_logstring = logstring
+
+    logname = getattr(caller, '_r_logname', None) if caller else ''
+    if logname is None:
+        logname = CYAN + get_logname(caller) + RESET_COLOR
+        if not hasattr(caller, '__slots__'):
+            caller._r_logname = logname
+
+    return logname, logstring
+
+
+def _format(record):
+    t, level, (file, lineno), (logname, logstring), args, kwargs, logstate, comment, parents = record
+
+    statestr = GREEN + ' '.join(k for k, v in logstate.items() if v) + RESET_COLOR
+
+    loc = "%s:%s" % (file, lineno)
+    if level >= 9:  # blink for panics
+        loc = BLINK + loc + RESET_COLOR
+
+    levelname = LEVELS[level][1] + LEVELS[level][0] + RESET_COLOR
+
+    timestamp = datetime.datetime.strftime(datetime.datetime.utcfromtimestamp(t - time.timezone), "%X.%f")
+    print(("%s %s %s %s %s %s in %s" % (timestamp, os.getpid(), levelname, loc, logname, statestr, logstring)),
+          file=OUTFILE, *(args + (comment,)))
+    for i, (file_, lineno, caller_name, logname) in enumerate(parents):
+        loc = "%s:%s" % (file_, lineno)
+        print(" " * (i + 1) + "(invoked by) %s  %s  %s" % (logname, caller_name, loc), file=OUTFILE)
+
+
+def flush():
+    """Writes out all pending log records; called automatically on errors and at exit."""
+    global _flushing
+    with _flush_lock:
+        if _flushing:  # something being formatted logged something itself
+            return
+        _flushing = True
+        # keeps the output of different processes from interleaving
+        _lock.acquire()
+        try:
+            dropped, _dropped[0] = _dropped[0], 0
+            if dropped:
+                print(RED, "!! %d log records dropped" % (dropped,), RESET_COLOR, file=OUTFILE)
+            while True:
+                try:
+                    record = _records.popleft()
+                except IndexError:
+                    break
+                try:
+                    _format(record)
+                except Exception:
+                    args = record[4]
+                    print(RED, "!!%d: (logger failure)" % (record[1],), file=sys.stderr, *args)
+                    print(RED, "...while trying to log", repr(args), repr(record[7]))
+                    print(traceback.format_exc(), RESET_COLOR, file=sys.stderr)
+        finally:
+            _flushing = False
+            _lock.release()
+
+
+def _start_writer():
+    global _writer_pid
+    with _flush_lock:
+        if _writer_pid != os.getpid():  # not yet started, or started in the parent process before a fork
+            _writer_pid = os.getpid()
+            writer = threading.Thread(target=_run_writer, name='spinoff.util.logging writer')
+            writer.daemon = True
+            writer.start()
+
+
+def _run_writer():
+    # the module globals might be gone by the time the interpreter is shutting down
+    pending, lock = _pending, _flush_lock
+    while True:
+        pending.wait()
+        pending.clear()
+        with lock:
+            if _exiting is not False:
+                return
+            flush()
+
+
+@atexit.register
+def _shutdown():
+    global _exiting
+    with _flush_lock:
+        flush()
+        _exiting = True
+
+
+# the records waiting to be written out by the writer thread; if it can't keep up, the oldest ones are dropped
+_records = deque(maxlen=RING_SIZE)
+_dropped = [0]
+_pending = threading.Event()
+_flush_lock = threading.RLock()
+_flushing = False
+_writer_pid = None
+_exiting = False
+
+
+# the log arguments that are only formatted by the writer thread, as they can't change in the meantime
+_DEFERRABLE = (str, unicode, int, long, float, bool, type(None))
 
 
 def get_logname(obj):
@@ -274,3 +396,48 @@ def logstring(logstr):
         fn._logstring = logstr
         return fn
     return dec
+
+
+class fmt(object):
+    """A `%`-formatted string that is only formatted if the log record it is passed in is not filtered out by `LEVEL`.
+
+        dbg(fmt("%r from %s", message, sender))
+
+    """
+    __slots__ = ('fmt', 'args')
+
+    def __init__(self, fmt, *args):
+        self.fmt, self.args = fmt, args
+
+    def __str__(self):
+        ret = self.fmt % self.args
+        return ret.encode('utf8') if isinstance(ret, unicode) else ret
+
+    def __repr__(self):
+        return 'fmt(%r)' % (str(self),)
+
+
+def set_production():
+    """Turns off debug logging for the rest of the lifetime of the process.
+
+    Modules imported before this is called keep their `dbg` bindings, which are reduced to a level check; setting
+    `SPINOFF_PRODUCTION` in the environment instead turns them into no-ops.
+
+    """
+    global PRODUCTION, LEVEL
+    PRODUCTION, LEVEL = True, max(LEVEL, 1)
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+if PRODUCTION:
+    LEVEL = max(LEVEL, 1)
+    dbg = dbg1 = dbg3 = _noop
+
+    def dbg_call(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def logstring(logstr):
+        return lambda fn: fn
@@ -44,6 +44,88 @@ def match(pattern, subject, flatten=True):
             (success if not values else (success,) + tuple(values)))
 
 
+# the types of the values that can be looked up by their hash instead of being compared one by one: their `__eq__` is
+# consistent with their `__hash__` and never delegates to a `Matcher`
+LITERAL_TYPES = (str, unicode, int, long, float, bool, type(None))
+
+
+class PatternTable(object):
+    """Finds the first of a sequence of patterns that is `==` to a subject.
+
+    Takes `(pattern, value)` pairs and compiles them into a decision tree so that `find` does not have to compare the
+    subject against every pattern in turn: tuple patterns are indexed by their length and, if their first item is a
+    literal (such as a `str` tag), also by that item; other literal patterns are indexed by themselves. Only the
+    patterns that can possibly match end up being compared against the subject, and only in the positions not already
+    covered by the index and not containing `ANY`.
+
+        >>> table = PatternTable([(('ping', ANY), 'on_ping'), (('pong', ANY, ANY), 'on_pong'), (ANY, 'other')])
+        >>> table.find(('pong', 1, 2))
+        'on_pong'
+        >>> table.find('whatever')
+        'other'
+
+    """
+    def __init__(self, items):
+        self.items = items = list(items)
+        # every candidate is `(index, value, pattern, checks)` where `checks` is a tuple of `(position, subpattern)` or
+        # `None` if the `pattern` is to be compared against the subject as a whole
+        generic, literals, tuples = [], {}, {}
+        for index, (pattern, value) in enumerate(items):
+            if isinstance(pattern, tuple):
+                heads, rest = tuples.setdefault(len(pattern), ({}, []))
+                literal_head = pattern and isinstance(pattern[0], LITERAL_TYPES)
+                checks = tuple((i, x) for i, x in enumerate(pattern) if x is not ANY and not (i == 0 and literal_head))
+                candidate = (index, value, pattern, checks)
+                if literal_head:
+                    heads.setdefault(pattern[0], []).append(candidate)
+                else:
+                    rest.append(candidate)
+            elif isinstance(pattern, LITERAL_TYPES):
+                literals.setdefault(pattern, []).append((index, value, pattern, ()))
+            else:
+                generic.append((index, value, pattern, None))
+
+        # the patterns that aren't indexed have to be merged into every list of candidates, retaining the order
+        def merge(*candidate_lists):
+            return tuple(sorted(sum(candidate_lists, [])))
+
+        self._generic = merge(generic)
+        self._literals = dict((literal, merge(candidates, generic)) for literal, candidates in literals.items())
+        self._tuples = dict(
+            (length, (dict((head, merge(candidates, rest, generic)) for head, candidates in heads.items()),
+                      merge(rest, generic)))
+            for length, (heads, rest) in tuples.items())
+
+    def find(self, subject, default=None):
+        """Returns the value of the first pattern that matches `subject`, or `default` if none do."""
+        if isinstance(subject, tuple):
+            heads, candidates = self._tuples.get(len(subject), (None, self._generic))
+            if heads:
+                try:
+                    candidates = heads.get(subject[0], candidates)
+                except TypeError:  # unhashable head; only the patterns not indexed by their head can match
+                    pass
+        else:
+            try:
+                candidates = self._literals.get(subject, self._generic)
+            except TypeError:  # unhashable subject; only the generic patterns can match
+                candidates = self._generic
+        for _, value, pattern, checks in candidates:
+            if checks is None:
+                if pattern == subject:
+                    return value
+            else:
+                for i, subpattern in checks:
+                    if not (subpattern == subject[i]):
+                        break
+                else:
+                    return value
+        return default
+
+    def __repr__(self):
+        return '<PatternTable(%s)>' % (', '.join(repr(pattern) for pattern, _ in self.items),)
+
+
 class _Marker(object):
     def __init__(self):
         pass
@@ -55,22 +137,29 @@ class _Marker(object):
         return "%s(<unknown>)" % (type(self).__name__,)
 
 
-class Matcher(_Marker):
-    ignore = False
-
-    def __new__(self, *args):
-        obj = super(Matcher, self).__new__(self)
+class _MatcherType(type):
+    """Works out the number of arguments taken by the constructor of each `Matcher` class once, when it's defined."""
 
+    def __init__(cls, name, bases, attrs):
+        super(_MatcherType, cls).__init__(name, bases, attrs)
         try:
-            argspec = inspect.getargspec(type(obj).__init__)
+            argspec = inspect.getargspec(cls.__init__)
         except TypeError:
-            return obj
+            cls._nargs = None
         else:
-            if argspec.varargs or argspec.keywords:
-                return obj
+            cls._nargs = None if argspec.varargs or argspec.keywords else len(argspec.args) - 1
+
+
+class Matcher(_Marker):
+    __metaclass__ = _MatcherType
 
-        nargs = len(argspec.args) - 1
-        if len(args) <= nargs:  # <= because for example (at least) copy.copy causes us to be called with no arguments
+    ignore = False
+
+    def __new__(cls, *args):
+        obj = super(Matcher, cls).__new__(cls)
+        nargs = cls._nargs
+        # <= because for example (at least) copy.copy causes us to be called with no arguments
+        if nargs is None or len(args) <= nargs:
             return obj
         else:
             obj.__init__(*args[:nargs])
@@ -224,11 +313,25 @@ class REGEXP(Matcher):
 
 
 class IN(Matcher):
+    """Matches anything that is one of the given `options`.
+
+    Sets, frozensets and dicts are used as they are, i.e. the matcher sees later changes to them; other collections are
+    snapshot into a `frozenset` if all of the options are plain literals, and into a `list` otherwise, so that options
+    with a custom `__eq__` (matchers included) are still compared with `==`.
+
+    """
     def __init__(self, options):
-        self.options = list(options)
+        if not isinstance(options, (set, frozenset, dict)):
+            options = list(options)
+            if all(isinstance(x, LITERAL_TYPES) for x in options):
+                options = frozenset(options)
+        self.options = options
 
     def __eq__(self, other):
-        return other in self.options
+        try:
+            return other in self.options
+        except TypeError:  # an unhashable `other` can't be equal to any of the (hashable) options
+            return False
 
     def __str__(self):
         return 'IN(%r)' % (self.options,)
@@ -67,8 +67,7 @@ def wrap_globals(globals):
         def ret(*args, **kwargs):
             # dbg("\n============================================\n")
 
-            # TODO: once the above TODO (fresh Node for each test fn) is complete, consider making Events non-global by
-            # having each Node have its own Events instance.
+            # each `Node` has its own `Events` but they all pass their events on to the process-wide one
             Events.reset()
 
             def check_memleaks():